@@ -1,63 +1,78 @@
 from collections import Counter
 
 import ebooklib
-from bs4 import BeautifulSoup
 from ebooklib import epub
+from lxml import etree
+from lxml import html as lxml_html
 
 INPUT_PATH = "data/book.epub"
 OUTPUT_PATH = "data/100_book.txt"
 
+# karakter -> csere (str.maketrans a több karakteres cserét is kezeli)
+ASCII_REPLACEMENTS = str.maketrans({
+    "©": "(c)",
 
-def extract_text(epub_path):
+    # dash-ek / minuszok
+    "–": "-",  # EN DASH
+    "—": "-",  # EM DASH
+    "‒": "-",  # FIGURE DASH
+    "−": "-",  # MINUS SIGN
+
+    # okos idézőjelek
+    "“": '"',
+    "”": '"',
+    "‘": "'",
+    "’": "'",
+
+    # ellipsis
+    "…": "...",
+
+    # non-breaking space -> sima space
+    "\u00A0": " ",
+
+    # zero-width space -> töröljük
+    "\u200B": "",
+})
+
+
+def iter_chapter_texts(epub_path):
+    """
+    Fejezetenként adja vissza a szöveget (generator), így a teljes könyv
+    soha nincs egyszerre a memóriában.
+    """
     book = epub.read_epub(epub_path)
-    texts = []
     for item in book.get_items():
         if item.get_type() == ebooklib.ITEM_DOCUMENT:
-            soup = BeautifulSoup(item.get_content(), "html.parser")
-            text = soup.get_text(separator=" ", strip=True)
+            content = item.get_content()
+            if not content.strip():
+                continue
+
+            # közvetlenül lxml: a szövegcsomópontokat szóközzel fűzzük össze,
+            # a whitespace-eket összevonjuk (mint BS get_text(separator=" ", strip=True))
+            root = lxml_html.document_fromstring(content)
+            etree.strip_elements(root, etree.Comment, "script", "style", with_tail=False)
+            text = " ".join(" ".join(root.itertext()).split())
             if text:
-                texts.append(text)
-    return "\n\n".join(texts)
+                yield text
 
 
 def normalize_ascii(text: str) -> str:
-    replacements = {
-        "©": "(c)",
+    # egyetlen str.translate menet a sok str.replace helyett
+    return text.translate(ASCII_REPLACEMENTS)
 
-        # dash-ek / minuszok
-        "–": "-",  # EN DASH
-        "—": "-",  # EM DASH
-        "‒": "-",  # FIGURE DASH
-        "−": "-",  # MINUS SIGN
 
-        # okos idézőjelek
-        "“": '"',
-        "”": '"',
-        "‘": "'",
-        "’": "'",
-
-        # ellipsis
-        "…": "...",
-
-        # non-breaking space -> sima space
-        "\u00A0": " ",
-
-        # zero-width space -> töröljük
-        "\u200B": "",
-    }
-
-    for src, tgt in replacements.items():
-        text = text.replace(src, tgt)
-    return text
+def count_non_ascii_chars(text: str, counter: Counter) -> None:
+    # str.isascii() C-ben fut és az első nem-ASCII karakternél megáll
+    if text.isascii():
+        return
+    counter.update(c for c in text if not c.isascii())
 
 
-def log_non_ascii_chars(text: str) -> None:
-    non_ascii_chars = [c for c in text if ord(c) > 127]
-    if not non_ascii_chars:
+def log_non_ascii_chars(counter: Counter) -> None:
+    if not counter:
         print("Nincsenek nem-ASCII karakterek a normalizálás után.")
         return
 
-    counter = Counter(non_ascii_chars)
     print("Nem-ASCII karakterek a normalizálás után (karakter | kód | darab):")
     for char, count in sorted(counter.items(), key=lambda x: ord(x[0])):
         codepoint = ord(char)
@@ -65,14 +80,19 @@ def log_non_ascii_chars(text: str) -> None:
 
 
 def main():
-    full_text = extract_text(INPUT_PATH)
+    non_ascii_counter = Counter()
 
-    full_text = normalize_ascii(full_text)
+    # fejezetenként normalizálunk és írunk, a fejezetek között üres sorral
+    with open(OUTPUT_PATH, "wb") as f:
+        for i, text in enumerate(iter_chapter_texts(INPUT_PATH)):
+            text = normalize_ascii(text)
+            count_non_ascii_chars(text, non_ascii_counter)
 
-    log_non_ascii_chars(full_text)
+            if i:
+                f.write(b"\n\n")
+            f.write(text.encode("utf-8"))
 
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-        f.write(full_text)
+    log_non_ascii_chars(non_ascii_counter)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
-import json
 import os
 import re
 
+import orjson
 import spacy
 
 INPUT_PATH = "data/100_book.txt"
@@ -10,23 +10,27 @@ OUTPUT_PATH = "data/200_chunks.jsonl"
 NLP = spacy.blank("en")
 NLP.add_pipe("sentencizer")
 
+# bármilyen whitespace-sorozat (a sortörést is beleértve)
+WHITESPACE_RE = re.compile(r"\s+")
 
-def split_to_sentences(text: str):
-    # sortörések
-    text = text.replace("\n", " ")
-    # whitespace-ek -> egy space
-    text = re.sub(r"\s+", " ", text).strip()
-
-    doc = NLP(text)
-    sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
-    return sentences
+# ennyi szövegblokkot adunk át egyszerre a spaCy-nek (nlp.pipe)
+NLP_BATCH_SIZE = 64
 
 
-def build_sentence_records(sentences):
-    return [
-        {"id": i, "sentence": sentence}
-        for i, sentence in enumerate(sentences)
-    ]
+def split_to_sentences(text: str):
+    """
+    A könyvet a fejezethatároknál (üres sor, ld. 100) blokkokra vágja,
+    és a blokkokat NLP.pipe-pal, batch-elve futtatja át a sentencizeren,
+    így nem jön létre egyetlen, az egész könyvet tartalmazó Doc.
+    """
+    # sortörések + whitespace-ek -> egy space, egyetlen menetben (blokkonként)
+    blocks = [WHITESPACE_RE.sub(" ", block).strip() for block in text.split("\n\n")]
+    blocks = [block for block in blocks if block]
+
+    sentences = []
+    for doc in NLP.pipe(blocks, batch_size=NLP_BATCH_SIZE):
+        sentences.extend(sent.text.strip() for sent in doc.sents if sent.text.strip())
+    return sentences
 
 
 def main():
@@ -34,17 +38,19 @@ def main():
         text = f.read()
 
     sentences = split_to_sentences(text)
-    records = build_sentence_records(sentences)
 
     out_dir = os.path.dirname(OUTPUT_PATH)
     if out_dir:
         os.makedirs(out_dir, exist_ok=True)
 
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as out:
-        for rec in records:
-            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    # egyetlen write hívás: nincs köztes rekord-lista, nincs soronkénti write
+    with open(OUTPUT_PATH, "wb") as out:
+        out.write(b"".join(
+            orjson.dumps({"id": i, "sentence": sentence}) + b"\n"
+            for i, sentence in enumerate(sentences)
+        ))
 
-    print(f"Written {len(records)} sentences to {OUTPUT_PATH}")
+    print(f"Written {len(sentences)} sentences to {OUTPUT_PATH}")
 
 
 if __name__ == "__main__":
@@ -1,15 +1,25 @@
-import json
 import os
 import re
 from collections import defaultdict
 
+import orjson
 import spacy
 
 CHUNKS_PATH = "data/200_chunks.jsonl"
 OUTPUT_PATH = "data/300_word_contexts.jsonl"
 
-# spaCy modell – ugyanaz, mint a 400-asban
-NLP = spacy.load("en_core_web_sm")
+# spaCy modell – ugyanaz, mint a 400-asban, de itt csak a tokenizer kell,
+# ezért a pipeline komponenseit (és a súlyaikat) be sem töltjük
+NLP = spacy.load(
+    "en_core_web_sm",
+    exclude=["tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer", "ner"],
+)
+
+# ennyi mondatot adunk át egyszerre a tokenizernek
+NLP_BATCH_SIZE = 1000
+
+# minden bájt, ami nem [A-Za-z] – normalize_for_match ezeket törli (bytes.translate)
+NON_LETTER_BYTES = bytes(b for b in range(256) if not (65 <= b <= 90 or 97 <= b <= 122))
 
 # csak kisbetűs angol betűk
 WORD_OK_RE = re.compile(r"^[a-z]+$")
@@ -20,47 +30,55 @@ def normalize_for_match(text: str) -> str:
     csak az angol betűk maradnak, minden más kidobva.
     Pl. 'Mrs.' -> 'mrs', 'can't' -> 'cant'.
     """
-    return re.sub(r"[^A-Za-z]", "", text).lower()
+    return text.encode("ascii", "ignore").translate(None, NON_LETTER_BYTES).lower().decode("ascii")
 
 
 def main():
-    word_contexts = defaultdict(set)
+    # word -> context ID-k listája (növekvő sorrendben, ismétlés nélkül)
+    word_contexts = defaultdict(list)
 
-    with open(CHUNKS_PATH, encoding="utf-8") as f:
+    cids = []
+    sentences = []
+    with open(CHUNKS_PATH, "rb") as f:
         for line in f:
-            rec = json.loads(line)
-            cid = rec["id"]
-            sentence = rec["sentence"]
-
-            # mondat tokenizálása spaCy-vel
-            doc = NLP(sentence)
-
-            for token in doc:
-                word = normalize_for_match(token.text)
-                if not word:
-                    continue
-
-                # csak "normál" szavak: min. 3 karakter, csak betű
-                if len(word) < 3:
-                    continue
-                if not WORD_OK_RE.match(word):
-                    continue
-
-                # context ID felvétele
-                word_contexts[word].add(cid)
+            rec = orjson.loads(line)
+            cids.append(rec["id"])
+            sentences.append(rec["sentence"])
+
+    # mondatok tokenizálása spaCy-vel – itt csak a token.text kell,
+    # ezért a teljes pipeline helyett elég a tokenizer (ugyanaz, mint a 400-asban)
+    docs = NLP.tokenizer.pipe(sentences, batch_size=NLP_BATCH_SIZE)
+
+    for cid, doc in zip(cids, docs):
+        for token in doc:
+            word = normalize_for_match(token.text)
+            if not word:
+                continue
+
+            # csak "normál" szavak: min. 3 karakter, csak betű
+            if len(word) < 3:
+                continue
+            if not WORD_OK_RE.match(word):
+                continue
+
+            # context ID felvétele – a mondatok id szerint növekvő sorrendben
+            # jönnek, így elég az utolsó elemmel összevetni, a lista rendezett marad
+            ids = word_contexts[word]
+            if not ids or ids[-1] != cid:
+                ids.append(cid)
 
     # fájl kiírása
     out_dir = os.path.dirname(OUTPUT_PATH)
     if out_dir:
         os.makedirs(out_dir, exist_ok=True)
 
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as out:
+    with open(OUTPUT_PATH, "wb") as out:
         for w, ids in word_contexts.items():
             rec = {
                 "word": w,
-                "contexts": sorted(ids),
+                "contexts": ids,
             }
-            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.write(orjson.dumps(rec) + b"\n")
 
     print(f"Written {len(word_contexts)} word records to {OUTPUT_PATH}")
 
@@ -1,22 +1,28 @@
-import json
 import os
-import re
 from collections import defaultdict
 
+import orjson
 import spacy
 
 WORD_CONTEXTS_PATH = "data/300_word_contexts.jsonl"
 CHUNKS_PATH = "data/200_chunks.jsonl"
 OUTPUT_PATH = "data/400_word_pos.jsonl"
 
-# csak kisbetűs angol betűk
-WORD_OK_RE = re.compile(r"^[a-z]+$")
-
 # Kiszűrendő POS-ok: tulajdonnév, szimbólum, írásjel, egyéb szófaj, szóköz
 BAD_POS = {"PROPN", "SYM", "PUNCT", "X", "SPACE"}
 
-# spaCy modell
-NLP = spacy.load("en_core_web_sm")
+# spaCy modell – a parser és a NER kimenetét nem használjuk, kikapcsoljuk őket
+# (a POS-hoz a tagger + attribute_ruler, a lemmához a lemmatizer kell)
+NLP = spacy.load("en_core_web_sm", disable=["parser", "ner"])
+
+# ennyi mondatot adunk át egyszerre a spaCy-nek (nlp.pipe)
+NLP_BATCH_SIZE = 1000
+
+# a tagger CPU-kötött: ennyi párhuzamos folyamatban fut (egy magot meghagyunk)
+NLP_N_PROCESS = max(1, (os.cpu_count() or 1) - 1)
+
+# minden bájt, ami nem [A-Za-z] – normalize_for_match ezeket törli (bytes.translate)
+NON_LETTER_BYTES = bytes(b for b in range(256) if not (65 <= b <= 90 or 97 <= b <= 122))
 
 
 def accept_word_form(word: str) -> bool:
@@ -25,21 +31,30 @@ def accept_word_form(word: str) -> bool:
       - csak [a-z] betűkből áll
       - legalább 3 karakter hosszú
     Semmi stopword, semmi extra okoskodás.
+
+    Regex helyett str-metódusok (C-ben futnak, match objektum nélkül):
+    isascii + isalpha + islower együtt pontosan a ^[a-z]+$ mintát adja.
     """
-    if len(word) < 3:
-        return False
-    if not WORD_OK_RE.match(word):
-        return False
-    return True
+    return len(word) >= 3 and word.isascii() and word.isalpha() and word.islower()
+
 
+def load_chunks(needed_ids):
+    """
+    chunk_id -> sentence, listaként: a 200 0-tól folytonosan számozza a mondatokat,
+    így a chunk_id közvetlenül lista-index (nincs dict-overhead).
 
-def load_chunks():
-    """chunk_id -> sentence"""
-    chunks = {}
-    with open(CHUNKS_PATH, encoding="utf-8") as f:
+    Csak a `needed_ids`-ben szereplő mondatokat tartjuk meg, a többi helyén
+    (és a számozás esetleges lyukaiban) None áll.
+    """
+    chunks = []
+    with open(CHUNKS_PATH, "rb") as f:
         for line in f:
-            rec = json.loads(line)
+            rec = orjson.loads(line)
             cid = rec["id"]
+            if cid not in needed_ids:
+                continue
+            if cid >= len(chunks):
+                chunks.extend([None] * (cid + 1 - len(chunks)))
             chunks[cid] = rec["sentence"]
     return chunks
 
@@ -50,109 +65,131 @@ def normalize_for_match(text: str) -> str:
     csak [A-Za-z] betűk maradnak, lower-case.
     Pl. 'Mrs.' -> 'mrs'
     """
-    return re.sub(r"[^A-Za-z]", "", text).lower()
+    return text.encode("ascii", "ignore").translate(None, NON_LETTER_BYTES).lower().decode("ascii")
 
 
-def collect_lemma_and_pos_from_contexts(word: str, contexts, chunks, nlp_cache):
+def collect_lemma_and_pos(watch, chunks):
     """
-    Végigmegy a szó összes context chunkján, és összegyűjti:
-      - az összes (lemma, POS) párt (lemma_pos_set),
-      - (lemma, POS) -> azok a context ID-k, ahol így fordult elő (lemma_pos_to_contexts).
+    Egyetlen menetben végigmegy az összes szükséges mondaton (NLP.pipe, batch-elve),
+    és minden tokenből rögtön rögzíti a (szó, lemma, POS, chunk_id) előfordulást.
+    Így minden mondat pontosan egyszer kerül tagelésre, függetlenül attól,
+    hány szó hivatkozik rá.
+
+    `watch`: chunk_id -> azok a szavak, amelyek erre a mondatra hivatkoznak
+    (fordított index a word_contexts alapján). Egy token csak akkor számít,
+    ha a szava az adott mondat figyelőlistáján van – pontosan úgy, mintha
+    szavanként a saját context-jein mennénk végig. Visszaad:
+      - found_words: azok a szavak, amelyek legalább egyszer előfordultak
+        (még a BAD_POS szűrés előtt),
+      - word_to_lemma_pos_contexts: word -> (lemma, POS) -> context ID-k,
+        BAD_POS nélkül.
 
     Nincs fallback, csak tényleges előfordulás számít.
     """
-    lemma_pos_set = set()
-    lemma_pos_to_contexts = defaultdict(set)
+    cids = [cid for cid in sorted(watch) if cid < len(chunks) and chunks[cid]]
+    sentences = [chunks[cid] for cid in cids]
 
-    for cid in contexts:
-        sentence = chunks.get(cid)
-        if not sentence:
-            continue
+    found_words = set()
+    # a context ID-k listában (nem set-ben) gyűlnek: a mondatok növekvő id szerint
+    # jönnek, így az utolsó elemmel összevetve ismétlés nélkül bővíthető
+    word_to_lemma_pos_contexts = defaultdict(lambda: defaultdict(list))
 
-        if cid in nlp_cache:
-            doc = nlp_cache[cid]
-        else:
-            doc = NLP(sentence)
-            nlp_cache[cid] = doc
+    docs = NLP.pipe(sentences, batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS)
 
+    for cid, doc in zip(cids, docs):
+        watched_words = watch[cid]
         for token in doc:
-            norm = normalize_for_match(token.text)
-            if not norm:
+            word = normalize_for_match(token.text)
+            if word not in watched_words:
                 continue
-            if norm == word:
-                lemma = token.lemma_.lower()
-                pos = token.pos_
-                lemma_pos_set.add((lemma, pos))
-                lemma_pos_to_contexts[(lemma, pos)].add(cid)
 
-    return lemma_pos_set, lemma_pos_to_contexts
+            found_words.add(word)
+
+            pos = token.pos_
+            if pos in BAD_POS:
+                continue
+
+            lemma = token.lemma_.lower()
+            ctx_ids = word_to_lemma_pos_contexts[word][(lemma, pos)]
+            if not ctx_ids or ctx_ids[-1] != cid:
+                ctx_ids.append(cid)
+
+    return found_words, word_to_lemma_pos_contexts
 
 
 def main():
     os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
 
-    chunks = load_chunks()
-
     total_words = 0
-    written_records = 0
     skipped_form = 0
     skipped_all_propn_or_empty = 0
 
-    nlp_cache = {}  # chunk_id -> Doc
-
-    with open(WORD_CONTEXTS_PATH, encoding="utf-8") as f_in, \
-            open(OUTPUT_PATH, "w", encoding="utf-8") as f_out:
-
-        for line in f_in:
-            total_words += 1
-            rec = json.loads(line)
-            word = rec["word"]      # lower-case
-            contexts = rec["contexts"]
-
-            # 1) alak alapú szűrés (regex + hossz)
-            if not accept_word_form(word):
-                skipped_form += 1
-                continue
+    with open(WORD_CONTEXTS_PATH, "rb") as f_in:
+        word_recs = [orjson.loads(line) for line in f_in]
+
+    # 1) alak alapú szűrés ([a-z] + hossz) – csak ezekre a szavakra gyűjtünk,
+    #    fordított index: chunk_id -> az oda hivatkozó (elfogadott) szavak
+    accepted_words = set()
+    watch = defaultdict(set)
+    for rec in word_recs:
+        word = rec["word"]
+        if accept_word_form(word):
+            accepted_words.add(word)
+            for cid in rec["contexts"]:
+                watch[cid].add(word)
+
+    # csak azokat a mondatokat töltjük be, amelyekre elfogadott szó hivatkozik
+    chunks = load_chunks(watch)
+
+    # 2) lemmák + POS-ok gyűjtése egyetlen menetben, az összes mondatból
+    print(f"Tagging {len(watch)} sentences with spaCy...")
+    found_words, word_to_lemma_pos_contexts = collect_lemma_and_pos(watch, chunks)
+
+    out_recs = []
+    for rec in word_recs:
+        total_words += 1
+        word = rec["word"]      # lower-case
+        contexts = rec["contexts"]
+
+        if word not in accepted_words:
+            skipped_form += 1
+            continue
 
-            # 2) lemmák + POS-ok gyűjtése MINDEN context-ből
-            lemma_pos_set, lemma_pos_to_contexts = collect_lemma_and_pos_from_contexts(
-                word, contexts, chunks, nlp_cache
-            )
+        # ha valamiért mégsem találtuk meg a szó előfordulását
+        if word not in found_words:
+            print(f"[WARN] Nincs előfordulás a szóra: {word}, contexts={contexts}")
+            skipped_all_propn_or_empty += 1
+            continue
 
-            # ha valamiért mégsem találtuk meg a szó előfordulását
-            if not lemma_pos_set:
-                print(f"[WARN] Nincs előfordulás a szóra: {word}, contexts={contexts}")
-                skipped_all_propn_or_empty += 1
-                continue
+        # ha csak “rossz” POS-ként létezett, akkor nem kell a kimenetbe
+        lemma_pos_to_contexts = word_to_lemma_pos_contexts.get(word)
+        if not lemma_pos_to_contexts:
+            skipped_all_propn_or_empty += 1
+            continue
 
-            # (lemma, pos) -> contexts szűrése BAD_POS alapján
-            lemma_pos_to_contexts = {
-                (lemma, pos): ctx_ids
-                for (lemma, pos), ctx_ids in lemma_pos_to_contexts.items()
-                if pos not in BAD_POS
+        # 3) egy sor MINDEN (lemma, POS) kombinációra
+        #    (a context lista már rendezett, ld. collect_lemma_and_pos)
+        for (lemma, pos) in sorted(lemma_pos_to_contexts):
+            out_rec = {
+                "word": word,
+                "lemma": lemma,
+                "pos": pos,
+                "contexts": lemma_pos_to_contexts[(lemma, pos)],
             }
 
-            lemma_pos_set = set(lemma_pos_to_contexts.keys())
-
-            # ha csak ilyen “rossz” POS-ként létezett, akkor nem kell a kimenetbe
-            if not lemma_pos_set:
-                skipped_all_propn_or_empty += 1
-                continue
-
-            # 3) egy sor MINDEN (lemma, POS) kombinációra
-            for (lemma, pos) in sorted(lemma_pos_set):
-                ctx_ids = lemma_pos_to_contexts.get((lemma, pos), set())
-                ctx_list = sorted(ctx_ids)
-
-                out_rec = {
-                    "word": word,
-                    "lemma": lemma,
-                    "pos": pos,
-                    "contexts": ctx_list,
-                }
-
-                f_out.write(json.dumps(out_rec, ensure_ascii=False) + "\n")
-                written_records += 1
+            out_recs.append(out_rec)
+
+    # (POS, lemma) szerint rendezve írjuk ki: az 500-as lépés ebben a sorrendben
+    # kérdezi a modellt, így az egymást követő promptok eleje (a POS-sorokig
+    # bezárólag) azonos, és az Ollama prefix KV-cache-e jobban kihasználható
+    # (ehhez a rekordokat a memóriában gyűjtjük; a contexts listák a
+    # word_to_lemma_pos_contexts-ből hivatkozva jönnek, nem másolatok, így ez
+    # rekordonként csak ~200 bájt, a word_recs mellett elhanyagolható)
+    out_recs.sort(key=lambda r: (r["pos"], r["lemma"], r["word"]))
+    with open(OUTPUT_PATH, "wb") as f_out:
+        for out_rec in out_recs:
+            f_out.write(orjson.dumps(out_rec) + b"\n")
+    written_records = len(out_recs)
 
     print(
         f"Total words: {total_words}, "
@@ -1,15 +1,33 @@
-import json
+import argparse
+import asyncio
+import functools
+import hashlib
+import heapq
+import itertools
 import os
+import queue
 import re
-import requests
-import random
+import sqlite3
+import threading
 import time
-import tiktoken
+
+import httpx
+import orjson
 
 # Bemeneti / kimeneti fájlok
 CHUNKS_PATH = "data/200_chunks.jsonl"       # id + sentence
 WORDS_PATH = "data/400_word_pos.jsonl"      # word, lemma, pos (STRING), contexts[]
 OUTPUT_PATH = "data/500_word_senses_gemma3.jsonl"  # 1 sor / szó (lemma+POS szinten)
+CACHE_PATH = "data/500_gloss_cache.sqlite"  # modell+lemma+POS+példák -> glossza (újrafuttatáshoz)
+
+# ennyi új cache-bejegyzés után commitolunk (fsync ritkítása)
+CACHE_COMMIT_EVERY = 50
+
+# ennyi kiírt sor után flush-oljuk a kimeneti fájlt
+OUTPUT_FLUSH_EVERY = 32
+
+# az író szálnak átadott, még ki nem írt eredmények max. száma
+WRITER_QUEUE_SIZE = 1024
 
 # Max ennyi példamondatot adunk át kontextusnak egy szóhoz
 MAX_EXAMPLES_PER_WORD = 5
@@ -21,9 +39,30 @@ BOOK_INFO = (
     "set on a farm run by animals."
 )
 
-# Ollama beállítások
-OLLAMA_URL = "http://localhost:11434/v1/chat/completions"
-MODEL_NAME_GLOSS = "gemma3:27b"
+# Ollama beállítások (natív /api/generate végpont)
+OLLAMA_URL = "http://localhost:11434/api/generate"
+# A modell a GLOSS_MODEL környezeti változóval vagy a --model kapcsolóval
+# cserélhető, pl. egy kisebb kvantált modellre (egyszeri lépés: ollama pull
+# gemma3:4b-it-q4_K_M). Az Ollama alap "gemma3:27b" tagje is 4 bites (Q4_K_M).
+MODEL_NAME_GLOSS = os.environ.get("GLOSS_MODEL", "gemma3:27b")
+
+# a modell ennyi ideig marad betöltve két kérés között
+OLLAMA_KEEP_ALIVE = "1h"
+
+# kontextusablak (token) – egy teljes köteg promptja + válasza is elfér benne
+OLLAMA_NUM_CTX = 4096
+
+# Ennyi szót kérdezünk egyetlen promptban (a közös prompt-eleje így kötegenként
+# csak egyszer megy át a hálózaton és a modellen). 1 = szavanként egy hívás.
+GLOSS_BATCH_SIZE = 8
+
+# Egyszerre ennyi kérés fut az Ollama felé. Csak akkor gyorsít, ha a szerver is
+# párhuzamosan szolgál ki: az Ollamát ugyanezzel az OLLAMA_NUM_PARALLEL
+# környezeti változóval kell indítani (pl. OLLAMA_NUM_PARALLEL=8 ollama serve).
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", "8"))
+
+# Egy kérés max. ideje (mp) – a nagy modell első válasza is beleférjen
+OLLAMA_TIMEOUT = 600
 
 # POS angol magyarázat a prompthoz (csak azokat, amiket tényleg használunk)
 POS_DESC_EN = {
@@ -59,21 +98,151 @@ POS_MAP_HU = {
     "INTJ": "indulatszó",
 }
 
-# Token becsléshez globális számlálók
-TOTAL_INPUT_TOKENS = 0
-TOTAL_OUTPUT_TOKENS = 0
+# Zárt szóosztályok (névelő, elöljárószó, kötőszó, névmás, ...) gyakori szavai:
+# ezekhez nem kérdezzük a modellt, kézzel írt glosszát használunk.
+# (lemma, POS) -> (magyar glossza, példamondat felszíni alakkal, példamondat lemmával)
+# Csak akkor használjuk, ha a felszíni alak megegyezik a lemmával. A 3 betűnél
+# rövidebb szavak (a, an, of, to, ...) már a 400-as lépésben kiesnek.
+CLOSED_HU = {
+    ("the", "DET"): ("a, az", "The cat is asleep.", "The farm is quiet."),
+    ("this", "DET"): ("ez", "This house is old.", "This road is long."),
+    ("that", "DET"): ("az", "That tree is tall.", "That door is open."),
+    ("these", "DET"): ("ezek", "These apples are ripe.", "These boots are new."),
+    ("those", "DET"): ("azok", "Those birds are loud.", "Those days are gone."),
+    ("some", "DET"): ("néhány", "Some men came in.", "Some water is left."),
+    ("any", "DET"): ("bármilyen", "Do you have any bread?", "Any child can do it."),
+    ("every", "DET"): ("minden", "Every dog barks.", "Every morning is cold."),
+    ("each", "DET"): ("mindegyik", "Each horse had a name.", "Each room is clean."),
+    ("all", "DET"): ("összes, minden", "All the animals ran.", "All the doors were shut."),
+    ("both", "DET"): ("mindkét", "Both pigs were asleep.", "Both hands were cold."),
+    ("another", "DET"): ("egy másik", "Take another apple.", "Another day began."),
+    ("for", "ADP"): ("számára, -ért", "This is for you.", "He worked for food."),
+    ("with", "ADP"): ("-val, -vel", "She came with her sister.", "He cut it with a knife."),
+    ("from", "ADP"): ("-tól, -től", "A letter from my father.", "She came from the town."),
+    ("into", "ADP"): ("-ba, -be", "He walked into the barn.", "She fell into the river."),
+    ("about", "ADP"): ("-ról, -ről", "A story about a horse.", "They talked about the harvest."),
+    ("over", "ADP"): ("fölött, át", "A bird flew over the field.", "He jumped over the wall."),
+    ("under", "ADP"): ("alatt", "The cat is under the table.", "They sat under a tree."),
+    ("after", "ADP"): ("után", "We met after dinner.", "After the rain, the sun came out."),
+    ("before", "ADP"): ("előtt", "Wash your hands before lunch.", "He stood before the gate."),
+    ("between", "ADP"): ("között", "The house stands between two hills.", "Choose between these two."),
+    ("through", "ADP"): ("keresztül, át", "They walked through the forest.", "Light came through the window."),
+    ("without", "ADP"): ("nélkül", "He left without a word.", "Tea without sugar is bitter."),
+    ("against", "ADP"): ("ellen", "They fought against the enemy.", "He leaned against the wall."),
+    ("during", "ADP"): ("alatt, folyamán", "He slept during the storm.", "It rained during the night."),
+    ("among", "ADP"): ("között", "She sat among her friends.", "The hut stood among the trees."),
+    ("and", "CCONJ"): ("és", "Bread and butter.", "He sang and danced."),
+    ("but", "CCONJ"): ("de", "It was cold but sunny.", "She is small but strong."),
+    ("nor", "CCONJ"): ("sem", "Neither he nor I knew.", "He did not eat, nor did he sleep."),
+    ("because", "SCONJ"): ("mert", "He stayed home because he was ill.", "We ran because it rained."),
+    ("although", "SCONJ"): ("bár", "Although it was late, we stayed.", "He smiled although he was sad."),
+    ("though", "SCONJ"): ("bár", "Though tired, she kept working.", "He came, though nobody asked him."),
+    ("while", "SCONJ"): ("míg, miközben", "She sang while she worked.", "While he slept, it snowed."),
+    ("until", "SCONJ"): ("amíg, -ig", "Wait until I come back.", "We worked until it got dark."),
+    ("unless", "SCONJ"): ("hacsak nem", "We will go unless it rains.", "Don't speak unless you are asked."),
+    ("whether", "SCONJ"): ("vajon, hogy", "I wonder whether he knows.", "Ask whether the shop is open."),
+    ("than", "SCONJ"): ("mint", "He is taller than his brother.", "It is better than nothing."),
+    ("you", "PRON"): ("te, ti", "I can see you.", "You are my friend."),
+    ("she", "PRON"): ("ő (nő)", "She is reading.", "She opened the door."),
+    ("they", "PRON"): ("ők", "They are at home.", "They worked all day."),
+    ("something", "PRON"): ("valami", "I heard something.", "Something is wrong."),
+    ("nothing", "PRON"): ("semmi", "There is nothing here.", "Nothing happened."),
+    ("everything", "PRON"): ("minden", "Everything is ready.", "He lost everything."),
+    ("anything", "PRON"): ("bármi", "Did you see anything?", "Anything is possible."),
+    ("everyone", "PRON"): ("mindenki", "Everyone was happy.", "He knows everyone."),
+    ("nobody", "PRON"): ("senki", "Nobody came.", "Nobody knows the answer."),
+    ("who", "PRON"): ("ki, aki", "Who is there?", "The man who called is here."),
+    ("what", "PRON"): ("mi, ami", "What is this?", "Tell me what you want."),
+    ("can", "AUX"): ("tud, -hat/-het", "I can swim.", "She can read well."),
+    ("will", "AUX"): ("fog (jövő idő)", "It will rain tomorrow.", "He will come soon."),
+    ("must", "AUX"): ("kell", "You must go now.", "We must work harder."),
+    ("should", "AUX"): ("kellene", "You should rest.", "We should ask him."),
+    ("may", "AUX"): ("-hat/-het, szabad", "You may leave now.", "It may snow tonight."),
+    ("might", "AUX"): ("lehet, hogy", "He might be late.", "It might rain later."),
+    ("could", "AUX"): ("tudott, -hatna/-hetne", "She could run fast.", "Could you help me?"),
+    ("would", "AUX"): ("-na/-ne (feltételes mód)", "I would like some tea.", "He would never lie."),
+    ("not", "PART"): ("nem", "I am not hungry.", "It is not far."),
+    ("one", "NUM"): ("egy", "I have one brother.", "One day he left."),
+    ("two", "NUM"): ("kettő, két", "Two cows were grazing.", "She has two sons."),
+    ("three", "NUM"): ("három", "Three men came.", "It took three days."),
+    ("four", "NUM"): ("négy", "The table has four legs.", "Four horses pulled the cart."),
+    ("five", "NUM"): ("öt", "Five sheep were lost.", "He waited five minutes."),
+    ("six", "NUM"): ("hat", "Six hens laid eggs.", "We left at six."),
+    ("seven", "NUM"): ("hét", "A week has seven days.", "Seven pigs were asleep."),
+    ("eight", "NUM"): ("nyolc", "Eight birds sat on the fence.", "She is eight years old."),
+    ("nine", "NUM"): ("kilenc", "Nine dogs barked.", "He woke at nine."),
+    ("ten", "NUM"): ("tíz", "Ten apples fell.", "I counted to ten."),
+    ("hundred", "NUM"): ("száz", "A hundred people came.", "It cost a hundred pounds."),
+    ("thousand", "NUM"): ("ezer", "A thousand stars shone.", "He walked a thousand miles."),
+    ("yes", "INTJ"): ("igen", "Yes, I agree.", "Yes, it is true."),
+    ("alas", "INTJ"): ("jaj, sajnos", "Alas, he was too late.", "Alas, the crop failed."),
+}
 
-# tiktoken encoder (OpenAI-féle cl100k_base)
-ENCODING = tiktoken.get_encoding("cl100k_base")
+# A prompt szóhoz független eleje. Minden kérésben bájtra azonos, így az Ollama
+# (llama.cpp) a prefix KV-cache-ét újra tudja használni, és csak a végére
+# fűzött, szóra jellemző részt kell újra kiértékelnie.
+PROMPT_PREFIX = f"""
+You are building a bilingual (English -> Hungarian) dictionary for a specific book.
 
+Book / corpus information:
+{BOOK_INFO}
 
-def estimate_tokens(text: str) -> int:
-    """
-    Token-becslés tiktoken-nel.
-    """
-    if not text:
-        return 0
-    return len(ENCODING.encode(text))
+At the end of this message I will give you:
+- one fixed part-of-speech (POS) tag for the word in the book, with its description
+- a base English word (lemma)
+- the original surface form (lowercase)
+- several example sentences from the book where this word appears (in various forms)
+
+YOUR JOB:
+1) Use the GIVEN POS exactly as provided. Do not guess or select another POS.
+2) Infer the GENERAL DICTIONARY MEANING of the word with this POS.
+3) Choose ONE common Hungarian word OR SHORT EXPRESSION (1-3 words) that best matches that meaning and POS.
+4) Create TWO TOTALLY DIFFERENT SHORT ENGLISH EXAMPLE SENTENCES (not from the book) that clearly show this meaning:
+   - The first must use the original surface form exactly as given.
+   - The second must use the lemma form.
+   - Both must use the word with the GIVEN POS.
+
+Details:
+- Focus on the BASE WORD (lemma), not on the specific inflected forms, when deciding meaning.
+- Do NOT reuse or quote the example sentences.
+- The Hungarian expression can be multi-word if that is the most natural dictionary equivalent (e.g. "szerzői jog").
+- If you are uncertain, guess the most likely general dictionary meaning.
+- NEVER answer with "Sajnálom", "Nem tudom", "I am sorry", "Sorry" or any similar meta-reply.
+
+VERY IMPORTANT OUTPUT FORMAT (EXACTLY THREE LINES, NO BULLETS, NO EXTRA TEXT):
+Line 1: HU=<ONE_HUNGARIAN_WORD_OR_SHORT_EXPRESSION>
+Line 2: <one short English sentence containing the surface form>
+Line 3: <one short English sentence containing the lemma>
+
+<ONE_HUNGARIAN_WORD_OR_SHORT_EXPRESSION> can be ONE or SEVERAL (1-3) Hungarian words.
+"""
+
+# Köteges kérésnél a PROMPT_PREFIX után jön (a prefix így változatlan marad).
+BATCH_PROMPT_NOTE = """
+This message contains {count} entries (ENTRY 1 ... ENTRY {count}), each with its own POS, lemma,
+surface form and example sentences. Process the entries INDEPENDENTLY, following the
+instructions above for each one.
+For each entry, output the three lines in the format above, then ONE empty line as a separator.
+Output EXACTLY {count} blocks, in the same order as the entries. Do NOT write entry numbers or headers.
+"""
+
+# Glossza-ellenőrzés / válasz-feldolgozás (modulszinten fordítva)
+HU_RE = re.compile(r"HU\s*[:=]\s*([^;]+)")
+STARTS_WITH_LETTER_RE = re.compile(r"^[a-záéíóöőúüű]")  # magyar ékezetekkel
+BLANK_LINE_RE = re.compile(r"\n\s*\n")
+# a köteges válaszba esetleg visszaírt "ENTRY n:" fejléc (csak a teljes sor)
+ENTRY_HEADER_RE = re.compile(r"ENTRY \d+:?", re.IGNORECASE)
+
+# ha a glossza első szava ezek bármelyikét tartalmazza, rossznak tekintjük
+# (egyetlen alternációs regex, egy menetben keres)
+BAD_GLOSS_RE = re.compile(r"sajnálom|nem tudom|sorry|i am sorry|i'm sorry|unknown|nincs|nem ismert")
+
+# Token-statisztikához globális számlálók (az Ollama által visszaadott értékek)
+TOTAL_INPUT_TOKENS = 0
+TOTAL_OUTPUT_TOKENS = 0
+
+# még nem commitolt cache-bejegyzések száma
+CACHE_PENDING = 0
 
 
 def load_chunks():
@@ -82,14 +251,73 @@ def load_chunks():
     (chunks.jsonl-ben: {"id": ..., "sentence": ...})
     """
     chunks = {}
-    with open(CHUNKS_PATH, encoding="utf-8") as f:
+    with open(CHUNKS_PATH, "rb") as f:
         for line in f:
-            rec = json.loads(line)
+            rec = orjson.loads(line)
             cid = rec["id"]
             chunks[cid] = rec["sentence"]
     return chunks
 
 
+def iter_word_recs():
+    """
+    A szóbejegyzések soronként, generátorként (nem tartjuk mind a memóriában).
+    """
+    with open(WORDS_PATH, "rb") as f:
+        for line in f:
+            yield orjson.loads(line)
+
+
+def count_lines(path: str) -> int:
+    """Sorok száma (a haladásjelzéshez és az ETA-hoz)."""
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def open_gloss_cache(path: str) -> sqlite3.Connection:
+    """
+    Perzisztens glossza-cache (SQLite). Kulcs: gloss_cache_key(),
+    érték: magyar glossza + a két angol példamondat.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS gloss ("
+        "key TEXT PRIMARY KEY, hu TEXT, ex_s TEXT, ex_l TEXT)"
+    )
+    return conn
+
+
+def gloss_cache_key(model: str, lemma: str, pos: str | None, example_sentences) -> str:
+    """
+    Pontos egyezésen alapuló kulcs: ugyanaz a modell, promptsablon, lemma, POS és
+    példamondat-halmaz -> ugyanaz a prompt, nem kell újra kérdezni a modellt.
+    Ha a PROMPT_PREFIX változik, a régi bejegyzések maguktól érvénytelenné válnak.
+    """
+    raw = "|".join([model, PROMPT_PREFIX, lemma, str(pos), *sorted(example_sentences)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def gloss_cache_get(conn: sqlite3.Connection, key: str):
+    """(hu, ex_s, ex_l) vagy None, ha nincs a cache-ben."""
+    return conn.execute(
+        "SELECT hu, ex_s, ex_l FROM gloss WHERE key = ?", (key,)
+    ).fetchone()
+
+
+def gloss_cache_put(conn: sqlite3.Connection, key: str, hu: str, ex_s: str, ex_l: str) -> None:
+    """Beírás a cache-be, CACHE_COMMIT_EVERY bejegyzésenként commit."""
+    global CACHE_PENDING
+
+    conn.execute(
+        "INSERT OR REPLACE INTO gloss (key, hu, ex_s, ex_l) VALUES (?, ?, ?, ?)",
+        (key, hu, ex_s, ex_l),
+    )
+    CACHE_PENDING += 1
+    if CACHE_PENDING >= CACHE_COMMIT_EVERY:
+        conn.commit()
+        CACHE_PENDING = 0
+
+
 def is_bad_gloss(gloss: str) -> bool:
     """
     Eldöntjük, hogy a glossza nyilvánvalóan rossz-e:
@@ -109,22 +337,11 @@ def is_bad_gloss(gloss: str) -> bool:
     first = g.split()[0]
     lower = first.lower()
 
-    bad_subs = [
-        "sajnálom",
-        "nem tudom",
-        "sorry",
-        "i am sorry",
-        "i'm sorry",
-        "unknown",
-        "nincs",
-        "nem ismert",
-    ]
-    for b in bad_subs:
-        if b in lower:
-            return True
+    if BAD_GLOSS_RE.search(lower):
+        return True
 
     # kezdődjön betűvel (magyar ékezeteket engedjük)
-    if not re.match(r"^[a-záéíóöőúüű]", lower):
+    if not STARTS_WITH_LETTER_RE.match(lower):
         return True
 
     # legyen épkézláb hossz (max ~20 karakter az ELSŐ szóra)
@@ -134,39 +351,43 @@ def is_bad_gloss(gloss: str) -> bool:
     return False
 
 
-def call_ollama(model: str, prompt: str, temperature: float = 0.1) -> tuple[str, int, int]:
+async def call_ollama(
+        client: httpx.AsyncClient,
+        model: str,
+        prompt: str,
+        temperature: float = 0.1,
+) -> tuple[str, int, int]:
     """
-    LLM-hívás Ollamához.
+    LLM-hívás Ollamához (aszinkron, a közös httpx klienssel).
     Visszatér:
       - content (string)
-      - estimated_input_tokens
-      - estimated_output_tokens
+      - input_tokens (prompt_eval_count)
+      - output_tokens (eval_count)
     A globális TOTAL_INPUT_TOKENS / TOTAL_OUTPUT_TOKENS értékét is növeli.
     """
     global TOTAL_INPUT_TOKENS, TOTAL_OUTPUT_TOKENS
 
     payload = {
         "model": model,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": temperature,
+        "prompt": prompt,
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {
+            "temperature": temperature,
+            "num_ctx": OLLAMA_NUM_CTX,
+        },
     }
 
-    # input token becslés (prompt)
-    input_tokens = estimate_tokens(prompt)
-
-    resp = requests.post(
-        OLLAMA_URL,
-        headers={"Content-Type": "application/json"},
-        data=json.dumps(payload),
-    )
+    # a kérés törzsét orjson-nal kódoljuk (a Content-Type a kliens alapfejléce)
+    resp = await client.post(OLLAMA_URL, content=orjson.dumps(payload))
     resp.raise_for_status()
-    data = resp.json()
-    content = data["choices"][0]["message"]["content"]
+    data = orjson.loads(resp.content)
+    content = data["response"]
 
-    # output token becslés
-    output_tokens = estimate_tokens(content)
+    # pontos tokenszámok a modell saját tokenizálójával; ha a prompt eleje a
+    # KV-cache-ből jött, a prompt_eval_count csak a ténylegesen kiértékelt részt adja
+    input_tokens = data.get("prompt_eval_count", 0)
+    output_tokens = data.get("eval_count", 0)
 
     # globális számlálók frissítése
     TOTAL_INPUT_TOKENS += input_tokens
@@ -182,7 +403,7 @@ def parse_gloss_line(line: str) -> str:
     POS-t már NEM várunk és nem is használjuk.
     """
     s = line.strip()
-    m_hu = re.search(r"HU\s*[:=]\s*([^;]+)", s)
+    m_hu = HU_RE.search(s)
     if m_hu:
         return m_hu.group(1).strip()
     # ha nem tartotta be a formát, vegyük az egész sort
@@ -203,25 +424,10 @@ def parse_example_lemma_en(line: str) -> str:
     return line.strip()
 
 
-def generate_hungarian_gloss_for_lemma(
-        lemma: str,
-        word: str,
-        pos: str | None,
-        example_sentences,
-):
+@functools.lru_cache(maxsize=None)
+def pos_prompt_lines(pos: str | None) -> str:
     """
-    Egy LLM-hívás LEMMA+POS szinten:
-      - fix POS tag az adott bejegyzéshez (spaCy-től)
-      - néhány példamondat a könyvből
-
-    Kimenet:
-      - magyar címszó vagy rövid kifejezés (1-3 szó)
-      - 2 rövid angol példamondat:
-          * example_surface_en: az eredeti word alakot használva
-          * example_lemma_en: a lemma alakot használva
-
-    Plusz:
-      - input / output token becslés az adott hívásra.
+    A prompt POS-sorai. Csak néhány különböző POS van, ezért memoizáljuk.
     """
     if pos:
         pos_desc = POS_DESC_EN.get(pos, "a part of speech")
@@ -231,56 +437,38 @@ def generate_hungarian_gloss_for_lemma(
         pos_info_line = "unknown (the model must infer it from the examples)"
         pos_tag_for_output = "unknown"
 
+    return (
+        f"The POS tag for this word in the book is: {pos_tag_for_output}\n"
+        f"Description of this POS tag: {pos_info_line}\n"
+    )
+
+
+def build_entry_block(lemma: str, word: str, pos: str | None, example_sentences) -> str:
+    """
+    A prompt szóra jellemző része (POS, lemma, felszíni alak, példamondatok).
+    A végén szavanként megismételjük, hogy a 2. / 3. sorban melyik alak
+    szerepeljen (a PROMPT_PREFIX-be nem írhatjuk, az szófüggetlen).
+    """
     examples_block = ""
     for i, s in enumerate(example_sentences, start=1):
         examples_block += f"{i}. {s}\n"
 
-    prompt = f"""
-You are building a bilingual (English -> Hungarian) dictionary for a specific book.
-
-Book / corpus information:
-{BOOK_INFO}
-
-I will give you:
-- a base English word (lemma)
-- the original surface form (lowercase)
-- one fixed part-of-speech (POS) tag for this word in the book
-- several example sentences from the book where this word appears (in various forms)
-
-YOUR JOB:
-1) Use the GIVEN POS exactly as provided. Do not guess or select another POS.
-2) Infer the GENERAL DICTIONARY MEANING of the word with this POS.
-3) Choose ONE common Hungarian word OR SHORT EXPRESSION (1-3 words) that best matches that meaning and POS.
-4) Create TWO TOTALLY DIFFERENT SHORT ENGLISH EXAMPLE SENTENCES (not from the book) that clearly show this meaning:
-   - The first must use the original surface form exactly as given.
-   - The second must use the lemma form.
-   - Both must use the word with the GIVEN POS.
-
-Details:
-- Focus on the BASE WORD (lemma), not on the specific inflected forms, when deciding meaning.
-- The POS tag for this word in the book is: {pos}
-- Description of this POS tag: {pos_info_line}
-- Do NOT reuse or quote the example sentences.
-- The Hungarian expression can be multi-word if that is the most natural dictionary equivalent (e.g. "szerzői jog").
-- If you are uncertain, guess the most likely general dictionary meaning.
-- NEVER answer with "Sajnálom", "Nem tudom", "I am sorry", "Sorry" or any similar meta-reply.
-
-Word (lemma): {lemma}
+    return f"""
+{pos_prompt_lines(pos)}Word (lemma): {lemma}
 Surface form (lowercase): {word}
 
 Example sentences from the book:
 {examples_block}
-
-VERY IMPORTANT OUTPUT FORMAT (EXACTLY THREE LINES, NO BULLETS, NO EXTRA TEXT):
-Line 1: HU=<ONE_HUNGARIAN_WORD_OR_SHORT_EXPRESSION>
-Line 2: <one short English sentence containing the surface form '{word}'>
-Line 3: <one short English sentence containing the lemma '{lemma}'>
-
-<ONE_HUNGARIAN_WORD_OR_SHORT_EXPRESSION> can be ONE or SEVERAL (1-3) Hungarian words.
+Line 2 must contain the surface form '{word}', Line 3 must contain the lemma '{lemma}'.
 """
 
-    raw, input_tokens, output_tokens = call_ollama(MODEL_NAME_GLOSS, prompt, temperature=0.1)
 
+def parse_gloss_block(raw: str) -> tuple[str, str, str]:
+    """
+    Egy szóhoz tartozó (max.) 3 soros válasz feldolgozása.
+    Visszaad: (hu_word, example_surface_en, example_lemma_en);
+    ValueError, ha üres vagy nyilvánvalóan rossz a glossza.
+    """
     lines = [ln.strip() for ln in raw.splitlines() if ln.strip()]
 
     if not lines:
@@ -299,9 +487,78 @@ Line 3: <one short English sentence containing the lemma '{lemma}'>
             f"bad gloss from main model: {hu_word!r} (raw first line: {first_line!r})"
         )
 
+    return hu_word, example_surface_en, example_lemma_en
+
+
+async def generate_hungarian_gloss_for_lemma(
+        client: httpx.AsyncClient,
+        lemma: str,
+        word: str,
+        pos: str | None,
+        example_sentences,
+):
+    """
+    Egy LLM-hívás LEMMA+POS szinten:
+      - fix POS tag az adott bejegyzéshez (spaCy-től)
+      - néhány példamondat a könyvből
+
+    Kimenet:
+      - magyar címszó vagy rövid kifejezés (1-3 szó)
+      - 2 rövid angol példamondat:
+          * example_surface_en: az eredeti word alakot használva
+          * example_lemma_en: a lemma alakot használva
+
+    Plusz:
+      - input / output tokenszám az adott hívásra.
+    """
+    prompt = PROMPT_PREFIX + build_entry_block(lemma, word, pos, example_sentences)
+
+    raw, input_tokens, output_tokens = await call_ollama(
+        client, MODEL_NAME_GLOSS, prompt, temperature=0.1
+    )
+
+    hu_word, example_surface_en, example_lemma_en = parse_gloss_block(raw)
     return hu_word, example_surface_en, example_lemma_en, input_tokens, output_tokens
 
 
+async def generate_hungarian_gloss_batch(client: httpx.AsyncClient, entries: list[dict]):
+    """
+    Több szó egyetlen LLM-hívásban. entries elemei: lemma, word, pos,
+    example_sentences kulcsokkal.
+
+    A válasz üres sorokkal elválasztott 3 soros blokkokból áll, szavanként egy.
+    Visszaad: (results, input_tokens, output_tokens), ahol results[i] a
+    (hu_word, example_surface_en, example_lemma_en) hármas, vagy None, ha az
+    adott blokk rossz (ezeket a hívó szavanként újrakérdezi).
+    ValueError, ha a blokkok száma nem egyezik a szavak számával.
+    """
+    prompt = PROMPT_PREFIX + BATCH_PROMPT_NOTE.format(count=len(entries))
+    for i, e in enumerate(entries, start=1):
+        prompt += f"\nENTRY {i}:" + build_entry_block(
+            e["lemma"], e["word"], e["pos"], e["example_sentences"]
+        )
+
+    raw, input_tokens, output_tokens = await call_ollama(
+        client, MODEL_NAME_GLOSS, prompt, temperature=0.1
+    )
+
+    # az esetleg mégis kiírt "ENTRY n:" fejléceket eldobjuk (csak a pontos
+    # fejlécsort: a "Entry ..." kezdetű példamondat megmarad)
+    lines = [ln for ln in raw.strip().splitlines() if not ENTRY_HEADER_RE.fullmatch(ln.strip())]
+    blocks = [b for b in BLANK_LINE_RE.split("\n".join(lines)) if b.strip()]
+    if len(blocks) != len(entries):
+        raise ValueError(f"batch answer has {len(blocks)} blocks for {len(entries)} entries")
+
+    results = []
+    for block in blocks:
+        try:
+            results.append(parse_gloss_block(block))
+        except ValueError:
+            results.append(None)
+
+    return results, input_tokens, output_tokens
+
+
 def format_eta(seconds: int) -> str:
     """
     Másodpercből HH:MM:SS string.
@@ -314,112 +571,321 @@ def format_eta(seconds: int) -> str:
     return f"{h:02d}:{m:02d}:{s:02d}"
 
 
-def main():
-    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+def select_example_ids(ctx_ids, chunks) -> list:
+    """
+    Max MAX_EXAMPLES_PER_WORD létező példamondat-azonosító, egyetlen menetben
+    és O(N) memóriával (a szűrt listát nem építjük fel):
+      - ha legfeljebb N érvényes van, mind, az eredeti sorrendben;
+      - különben a N legrövidebb mondat (azonos hossznál a kisebb id).
+    """
+    valid = (cid for cid in ctx_ids if cid in chunks)
+    if MAX_EXAMPLES_PER_WORD is None:
+        return list(valid)
+
+    head = list(itertools.islice(valid, MAX_EXAMPLES_PER_WORD))
+    nxt = next(valid, None)
+    if nxt is None:
+        return head
+    return heapq.nsmallest(
+        MAX_EXAMPLES_PER_WORD,
+        itertools.chain(head, (nxt,), valid),
+        key=lambda cid: (len(chunks[cid]), cid),
+    )
 
-    print("Loading chunks (sentences)...")
-    chunks = load_chunks()
-    print(f"Loaded {len(chunks)} sentences from {CHUNKS_PATH}")
 
-    # beolvassuk az összes szót, hogy tudjuk a total-t
-    with open(WORDS_PATH, encoding="utf-8") as f_in:
-        word_recs = [json.loads(line) for line in f_in]
+def prepare_word(w_idx: int, total_words: int, rec: dict, chunks):
+    """
+    Egy szóbejegyzés előkészítése: példamondatok kiválasztása.
+    Visszaad: a szó adatait (dict), vagy None, ha nincs használható kontextus.
+    """
+    word = rec["word"]                 # felszíni forma (lowercase)
+    lemma = rec.get("lemma") or word   # lemma
+    pos = rec.get("pos")               # fixed POS (STRING, spaCy-től)
+    ctx_ids = rec["contexts"]          # mondat-azonosítók
+
+    total_ctx_for_word = len(ctx_ids)
+
+    # max N példamondat kontextusnak: determinisztikusan a legrövidebbek
+    # (azonos bemenet -> azonos prompt, így a gloss-cache és az Ollama
+    # prefix-cache is találatot ad újrafuttatáskor)
+    selected_ids = select_example_ids(ctx_ids, chunks)
+    if not selected_ids:
+        return None
+
+    example_sentences = [chunks[cid] for cid in selected_ids]
+
+    print(
+        f"\n=== WORD {w_idx}/{total_words}: '{word}' "
+        f"(lemma='{lemma}', pos='{pos}', {len(selected_ids)}/{total_ctx_for_word} example sentences used) ===",
+        flush=True,
+    )
 
-    total_words = len(word_recs)
-    print(f"Loaded {total_words} word entries from {WORDS_PATH}")
-    print(f"MAX_EXAMPLES_PER_WORD = {MAX_EXAMPLES_PER_WORD}")
+    return {
+        "word": word,
+        "lemma": lemma,
+        "pos": pos,
+        "example_sentences": example_sentences,
+    }
 
-    written = 0
-    start_time = time.time()  # indulási idő az ETA-hoz
 
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as f_out:
-        for w_idx, rec in enumerate(word_recs, start=1):
-            word = rec["word"]                 # felszíni forma (lowercase)
-            lemma = rec.get("lemma") or word   # lemma
-            pos = rec.get("pos")               # fixed POS (STRING, spaCy-től)
-            ctx_ids = rec["contexts"]          # mondat-azonosítók
+def build_out_rec(entry: dict, gloss_hu: str, ex_surface: str, ex_lemma: str) -> dict:
+    """A kimeneti sor egy szóhoz."""
+    pos = entry["pos"]
+    pos_hu = POS_MAP_HU.get(pos, "") if pos else ""
+
+    return {
+        "word": entry["word"],
+        "lemma": entry["lemma"],
+        "pos": pos,                     # spaCy POS tag (STRING)
+        "pos_hu": pos_hu,               # magyar megnevezés (STRING)
+        "meaning_hu": gloss_hu,         # magyar alapszó vagy több szavas kifejezés
+        "example_surface_en": ex_surface,  # felszíni alakos példamondat
+        "example_lemma_en": ex_lemma,      # lemma-alakos példamondat
+        "ok": gloss_hu != "",
+    }
 
-            total_ctx_for_word = len(ctx_ids)
 
-            # véletlenül kiválasztunk max N példamondatot kontextusnak
-            valid_ids = [cid for cid in ctx_ids if cid in chunks]
-            if not valid_ids:
-                print(
-                    f"[word {w_idx}/{total_words}] '{word}' - SKIP: no valid contexts found"
-                )
+async def process_batch(
+        client: httpx.AsyncClient,
+        cache: sqlite3.Connection,
+        batch,
+        total_words: int,
+        chunks,
+):
+    """
+    Egy szóköteg feldolgozása: a CLOSED_HU táblában és a cache-ben lévő
+    szavakat onnan vesszük, a
+    többit egyetlen köteges LLM-hívással kérdezzük. Ha a köteges válasz nem
+    használható (vagy egy-egy blokkja rossz), az érintett szavakat egyenként
+    kérdezzük újra.
+
+    Visszaad: (word, out_rec, status, input_tokens, output_tokens) listát;
+    out_rec None, ha a szót kihagyjuk.
+    """
+    results = []
+    misses = []  # (results-index, entry, cache_key)
+
+    for w_idx, rec in batch:
+        entry = prepare_word(w_idx, total_words, rec, chunks)
+        if entry is None:
+            results.append((rec["word"], None, "SKIP: no valid contexts found", 0, 0))
+            continue
+
+        if entry["word"] == entry["lemma"]:
+            static = CLOSED_HU.get((entry["lemma"], entry["pos"]))
+            if static is not None:
+                results.append((entry["word"], build_out_rec(entry, *static), "OK-STATIC", 0, 0))
                 continue
 
-            if MAX_EXAMPLES_PER_WORD is not None and len(valid_ids) > MAX_EXAMPLES_PER_WORD:
-                selected_ids = random.sample(valid_ids, MAX_EXAMPLES_PER_WORD)
-            else:
-                selected_ids = list(valid_ids)
-
-            example_sentences = [chunks[cid] for cid in selected_ids]
-
-            print(
-                f"\n=== WORD {w_idx}/{total_words}: '{word}' "
-                f"(lemma='{lemma}', pos='{pos}', {len(selected_ids)}/{total_ctx_for_word} example sentences used) ===",
-                flush=True,
+        cache_key = gloss_cache_key(MODEL_NAME_GLOSS, entry["lemma"], entry["pos"], entry["example_sentences"])
+        cached = gloss_cache_get(cache, cache_key)
+        if cached is not None:
+            results.append((entry["word"], build_out_rec(entry, *cached), "OK (cache)", 0, 0))
+            continue
+
+        misses.append((len(results), entry, cache_key))
+        results.append(None)
+
+    batch_answers = [None] * len(misses)
+    batch_in = batch_out = 0
+    if len(misses) > 1:
+        try:
+            batch_answers, input_tokens, output_tokens = await generate_hungarian_gloss_batch(
+                client, [entry for _, entry, _ in misses]
             )
-
-            input_tokens = 0
-            output_tokens = 0
-
+            # a köteg tokenjeit a szavak között egyenlően osztjuk szét (csak kiíráshoz)
+            batch_in = input_tokens // len(misses)
+            batch_out = output_tokens // len(misses)
+        except Exception as e:
+            print(f"Batch of {len(misses)} words failed ({e}), falling back to single-word calls", flush=True)
+
+    for (res_idx, entry, cache_key), answer in zip(misses, batch_answers):
+        input_tokens = batch_in
+        output_tokens = batch_out
+        if answer is not None:
+            gloss_hu, ex_surface, ex_lemma = answer
+            status = "OK (batch)"
+            gloss_cache_put(cache, cache_key, gloss_hu, ex_surface, ex_lemma)
+        else:
             try:
-                gloss_hu, ex_surface, ex_lemma, input_tokens, output_tokens = generate_hungarian_gloss_for_lemma(
-                    lemma=lemma,
-                    word=word,
-                    pos=pos,
-                    example_sentences=example_sentences,
+                gloss_hu, ex_surface, ex_lemma, in_tok, out_tok = await generate_hungarian_gloss_for_lemma(
+                    client,
+                    lemma=entry["lemma"],
+                    word=entry["word"],
+                    pos=entry["pos"],
+                    example_sentences=entry["example_sentences"],
                 )
+                input_tokens += in_tok
+                output_tokens += out_tok
                 status = "OK"
+                gloss_cache_put(cache, cache_key, gloss_hu, ex_surface, ex_lemma)
             except Exception as e:
                 gloss_hu = ""
                 ex_surface = ""
                 ex_lemma = ""
                 status = f"ERROR: {e}"
 
-            pos_hu = POS_MAP_HU.get(pos, "") if pos else ""
+        out_rec = build_out_rec(entry, gloss_hu, ex_surface, ex_lemma)
+        results[res_idx] = (entry["word"], out_rec, status, input_tokens, output_tokens)
 
-            out_rec = {
-                "word": word,
-                "lemma": lemma,
-                "pos": pos,                     # spaCy POS tag (STRING)
-                "pos_hu": pos_hu,               # magyar megnevezés (STRING)
-                "meaning_hu": gloss_hu,         # magyar alapszó vagy több szavas kifejezés
-                "example_surface_en": ex_surface,  # felszíni alakos példamondat
-                "example_lemma_en": ex_lemma,      # lemma-alakos példamondat
-                "ok": gloss_hu != "",
-            }
+    return results
 
-            f_out.write(json.dumps(out_rec, ensure_ascii=False) + "\n")
+
+async def generate_all(word_recs, total_words: int, chunks, cache: sqlite3.Connection, f_out) -> int:
+    """
+    A szavakat GLOSS_BATCH_SIZE méretű kötegekben OLLAMA_NUM_PARALLEL párhuzamos
+    worker dolgozza fel (közös httpx.AsyncClient-tel). Az eredményeket egy külön
+    író szál írja ki, így a lemezre írás és a kiírások nem tartják fel az event
+    loopot (az új kérések indítását). A kötegek tetszőleges sorrendben
+    készülhetnek el; az író a korábban befejezetteket a szó indexe (w_idx)
+    szerint visszatartja, így a kimenet a bemenet sorrendjében készül, futásról
+    futásra ugyanúgy.
+
+    Visszaad: a kiírt bejegyzések száma.
+    """
+    work_queue = asyncio.Queue(maxsize=OLLAMA_NUM_PARALLEL * 2)
+    result_queue = queue.Queue(maxsize=WRITER_QUEUE_SIZE)
+    start_time = time.time()  # indulási idő az ETA-hoz
+    written = 0
+    writer_error = []  # az író szál kivétele (ha elhasal), a végén továbbdobjuk
+
+    async def producer():
+        items = enumerate(word_recs, start=1)
+        while batch := list(itertools.islice(items, GLOSS_BATCH_SIZE)):
+            await work_queue.put(batch)
+        for _ in range(OLLAMA_NUM_PARALLEL):
+            await work_queue.put(None)
+
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            batch = await work_queue.get()
+            if batch is None:
+                return
+            if writer_error:
+                raise writer_error[0]
+            results = await process_batch(client, cache, batch, total_words, chunks)
+            # a process_batch a köteg minden szavára pontosan egy eredményt ad, sorrendben
+            for (w_idx, _), result in zip(batch, results):
+                # a teli sorra várakozás külön szálon: nem állítja meg az event loopot
+                await asyncio.to_thread(result_queue.put, (w_idx, result))
+
+    def writer() -> None:
+        try:
+            write_results()
+        except BaseException as e:
+            writer_error.append(e)
+            # a maradékot eldobjuk, hogy a put-ok ne akadjanak el a teli soron
+            while result_queue.get() is not None:
+                pass
+
+    def write_results() -> None:
+        # w_idx -> eredmény: a sorrendből előre futó (még nem írható) eredmények
+        pending = {}
+        next_idx = 1
+        while True:
+            item = result_queue.get()
+            if item is None:
+                return
+            w_idx, result = item
+            pending[w_idx] = result
+            while next_idx in pending:
+                write_result(next_idx, pending.pop(next_idx))
+                next_idx += 1
+
+    def write_result(done: int, result) -> None:
+        nonlocal written
+        word, out_rec, status, input_tokens, output_tokens = result
+
+        if out_rec is None:
+            print(f"[word {done}/{total_words}] '{word}' - {status}")
+            return
+
+        f_out.write(orjson.dumps(out_rec) + b"\n")
+        written += 1
+        if written % OUTPUT_FLUSH_EVERY == 0:
             f_out.flush()
-            written += 1
-
-            # ETA számolás
-            elapsed = time.time() - start_time
-            avg_per_word = elapsed / w_idx
-            remaining_words = total_words - w_idx
-            eta_seconds = int(remaining_words * avg_per_word)
-            eta_str = format_eta(eta_seconds)
-
-            print(
-                f"[word {w_idx}/{total_words}] '{word}' -> {status} "
-                f"(HU='{gloss_hu}', tokens in={input_tokens}, out={output_tokens})",
-                flush=True,
-            )
-            print(
-                f"    Elapsed: {format_eta(int(elapsed))}, "
-                f"ETA remaining: {eta_str}",
-                flush=True,
+
+        # ETA számolás (a befejezett szavak alapján)
+        elapsed = time.time() - start_time
+        avg_per_word = elapsed / done
+        remaining_words = total_words - done
+        eta_seconds = int(remaining_words * avg_per_word)
+        eta_str = format_eta(eta_seconds)
+
+        print(
+            f"[word {done}/{total_words}] '{word}' -> {status} "
+            f"(HU='{out_rec['meaning_hu']}', tokens in={input_tokens}, out={output_tokens})",
+            flush=True,
+        )
+        print(
+            f"    Elapsed: {format_eta(int(elapsed))}, "
+            f"ETA remaining: {eta_str}",
+            flush=True,
+        )
+
+    # egy közös kapcsolat-pool: minden workernek jut egy keep-alive kapcsolat,
+    # így nem nyitunk új TCP kapcsolatot szavanként
+    limits = httpx.Limits(
+        max_connections=OLLAMA_NUM_PARALLEL,
+        max_keepalive_connections=OLLAMA_NUM_PARALLEL,
+        keepalive_expiry=OLLAMA_TIMEOUT,
+    )
+
+    writer_thread = threading.Thread(target=writer, name="gloss-writer")
+    writer_thread.start()
+    headers = {"Content-Type": "application/json"}
+    try:
+        async with httpx.AsyncClient(timeout=OLLAMA_TIMEOUT, limits=limits, headers=headers) as client:
+            await asyncio.gather(
+                producer(),
+                *(worker(client) for _ in range(OLLAMA_NUM_PARALLEL)),
             )
+    finally:
+        result_queue.put(None)
+        writer_thread.join()
+    if writer_error:
+        raise writer_error[0]
+    return written
+
+
+def main():
+    global MODEL_NAME_GLOSS
+
+    parser = argparse.ArgumentParser(description="Magyar glosszák generálása Ollamával")
+    parser.add_argument("--model", default=MODEL_NAME_GLOSS, help="Ollama modell (alapértelmezés: %(default)s)")
+    args = parser.parse_args()
+    MODEL_NAME_GLOSS = args.model
+
+    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+
+    print("Loading chunks (sentences)...")
+    chunks = load_chunks()
+    print(f"Loaded {len(chunks)} sentences from {CHUNKS_PATH}")
+
+    # a total-hoz elég megszámolni a sorokat, a szavakat menet közben olvassuk
+    total_words = count_lines(WORDS_PATH)
+    print(f"Found {total_words} word entries in {WORDS_PATH}")
+    print(f"MODEL_NAME_GLOSS = {MODEL_NAME_GLOSS}")
+    print(f"MAX_EXAMPLES_PER_WORD = {MAX_EXAMPLES_PER_WORD}")
+    print(f"GLOSS_BATCH_SIZE = {GLOSS_BATCH_SIZE}")
+    print(f"OLLAMA_NUM_PARALLEL = {OLLAMA_NUM_PARALLEL}")
+
+    start_time = time.time()
+
+    cache = open_gloss_cache(CACHE_PATH)
+    try:
+        with open(OUTPUT_PATH, "wb") as f_out:
+            written = asyncio.run(generate_all(iter_word_recs(), total_words, chunks, cache, f_out))
+    finally:
+        cache.commit()
+        cache.close()
 
     total_elapsed = time.time() - start_time
     print(f"Done, written {written} entries to {OUTPUT_PATH}")
     print(f"Total elapsed time: {format_eta(int(total_elapsed))}")
-    print(f"Estimated total input tokens:  {TOTAL_INPUT_TOKENS}")
-    print(f"Estimated total output tokens: {TOTAL_OUTPUT_TOKENS}")
-    print(f"Estimated total tokens (in+out): {TOTAL_INPUT_TOKENS + TOTAL_OUTPUT_TOKENS}")
+    print(f"Total input tokens:  {TOTAL_INPUT_TOKENS}")
+    print(f"Total output tokens: {TOTAL_OUTPUT_TOKENS}")
+    print(f"Total tokens (in+out): {TOTAL_INPUT_TOKENS + TOTAL_OUTPUT_TOKENS}")
 
 
 if __name__ == "__main__":
@@ -1,13 +1,23 @@
-import json
+import argparse
+import asyncio
+import hashlib
+import heapq
+import itertools
+import math
 import os
 import re
 import random
+import sqlite3
 import time
+from functools import lru_cache
 from typing import Tuple
 
+import hunspell
+import orjson
 import tiktoken
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
-from openai import OpenAI, APIStatusError
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
 
 # .env betöltése (OPENAI_API_KEY innen is jöhet)
 load_dotenv()
@@ -16,6 +26,14 @@ load_dotenv()
 CHUNKS_PATH = "data/200_chunks.jsonl"       # id + sentence
 WORDS_PATH = "data/400_word_pos.jsonl"      # word, lemma, pos (STRING), contexts[]
 OUTPUT_PATH = "data/500_word_senses_openai.jsonl"  # 1 sor / szó (lemma+POS szinten)
+CACHE_PATH = "data/500_gloss_cache_openai.sqlite"  # modell+sablon+lemma+POS+példák -> glossza (saját fájl, nem a gemma3-é)
+
+# ennyi új cache-bejegyzés után commitolunk (fsync ritkítása)
+CACHE_COMMIT_EVERY = 50
+
+# ennyi kiírt sor után flush-oljuk a kimeneti fájlt (és ekkora a pufferje)
+OUTPUT_FLUSH_EVERY = 100
+OUTPUT_BUFFER_SIZE = 1 << 20
 
 # Max ennyi példamondatot adunk át kontextusnak egy szóhoz
 MAX_EXAMPLES_PER_WORD = 5
@@ -32,11 +50,87 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")  # .env-ből vagy env-ből jö
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY nincs beállítva (.env vagy env).")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# az újrapróbálást mi végezzük (ld. call_openai), az SDK sajátját kikapcsoljuk
+client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
 
 # Modell név (reasoning mini alias)
 MODEL_NAME_GLOSS = "gpt-5-mini"
 
+# Modell-lépcső: először az olcsóbb modellt kérdezzük, és csak akkor lépünk
+# tovább a következőre, ha a válasz formailag rossz vagy a glossza nem megy
+# át a hunspell-ellenőrzésen (ld. 550_word_senses_check.py). Az utolsó
+# modell válaszát a helyesírás-ellenőrzéstől függetlenül elfogadjuk.
+MODEL_TIERS = ["gpt-5-nano", MODEL_NAME_GLOSS]
+
+# hunspell: magyar szótár – hu_HU (ugyanaz, mint a 550-es ellenőrzésben)
+HUNSPELL_DIC = "/usr/share/hunspell/hu_HU.dic"
+HUNSPELL_AFF = "/usr/share/hunspell/hu_HU.aff"
+# csak main()-ben töltjük be (init_speller), nem importáláskor
+SPELLER = None
+
+# magyar + angol betűk – a helyesírás-ellenőrzéshez
+HU_TOKEN_RE = re.compile(r"[A-Za-zÁÉÍÓÖŐÚÜŰáéíóöőúüű]+")
+
+# Glossza-ellenőrzés / válasz-feldolgozás (modulszinten fordítva)
+HU_RE = re.compile(r"HU\s*[:=]\s*([^;]+)")
+STARTS_WITH_LETTER_RE = re.compile(r"^[a-záéíóöőúüű]")  # magyar ékezetekkel
+
+# ha a glossza első szava ezek bármelyikét tartalmazza, rossznak tekintjük
+# (egyetlen alternációs regex, egy menetben keres)
+BAD_GLOSS_RE = re.compile(r"sajnálom|nem tudom|sorry|i am sorry|i'm sorry|unknown|nincs|nem ismert")
+
+# Egyszerre ennyi kérés fut az OpenAI felé (a fiók RPM/TPM limitjéhez igazítandó)
+OPENAI_CONCURRENCY = int(os.environ.get("OPENAI_CONCURRENCY", "20"))
+
+# Ennyi szót kérdezünk egyetlen kérésben (strukturált JSON kimenettel), így a
+# közös utasításrész kötegenként csak egyszer megy át. 1 = szavanként egy hívás.
+GLOSS_BATCH_SIZE = 10
+
+# A köteges válasz JSON sémája: {"items": [{hu, ex_surface, ex_lemma}, ...]}
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "name": "glosses",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "hu": {"type": "string"},
+                        "ex_surface": {"type": "string"},
+                        "ex_lemma": {"type": "string"},
+                    },
+                    "required": ["hu", "ex_surface", "ex_lemma"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["items"],
+        "additionalProperties": False,
+    },
+}
+
+# Kliensoldali rate limit (a fiók limitjeihez igazítandó): percenkénti kérés-
+# és tokenszám. A kéréseket ehhez ütemezzük, hogy ne a 429-es hibák fogják vissza.
+MAX_RPM = int(os.environ.get("OPENAI_MAX_RPM", "500"))
+MAX_TPM = int(os.environ.get("OPENAI_MAX_TPM", "200000"))
+RPM_LIMITER = AsyncLimiter(MAX_RPM, 60)
+TPM_LIMITER = AsyncLimiter(MAX_TPM, 60)
+
+# Átmeneti hibáknál (429, 5xx, kapcsolati hiba) ennyiszer próbálkozunk,
+# exponenciális várakozással (max. RETRY_MAX_DELAY mp) + véletlen jitterrel
+MAX_ATTEMPTS = 6
+RETRY_MAX_DELAY = 60
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Batch API mód (--batch): az összes kérés egy fájlban megy fel, az eredmény
+# 24 órán belül érkezik, fele áron és külön rate limit kerettel.
+BATCH_INPUT_PATH = "data/500_batch_input.jsonl"
+BATCH_POLL_SECONDS = 60
+
 # POS angol magyarázat a prompthoz (csak azokat, amiket tényleg használunk)
 POS_DESC_EN = {
     "NOUN": "a noun (thing, person, concept)",
@@ -71,10 +165,128 @@ POS_MAP_HU = {
     "INTJ": "indulatszó",
 }
 
+# A prompt sablonja (str.format mezőkkel, ld. build_prompt). A szóspecifikus
+# mezők a végén vannak: a fix eleje így közös prefix (OpenAI prompt caching).
+PROMPT_TEMPLATE = """
+You are building a bilingual (English -> Hungarian) dictionary for a specific book.
+
+Book / corpus information:
+{book_info}
+
+I will give you:
+- a base English word (lemma)
+- the original surface form (lowercase)
+- one fixed part-of-speech (POS) tag for this word in the book
+- several example sentences from the book where this word appears (in various forms)
+
+YOUR JOB:
+1) Use the GIVEN POS exactly as provided. Do not guess or select another POS.
+2) Infer the GENERAL DICTIONARY MEANING of the word with this POS.
+3) Choose ONE common Hungarian word OR SHORT EXPRESSION (1-3 words) that best matches that meaning and POS.
+   IMPORTANT: the Hungarian expression must be a clean dictionary headword or short phrase ONLY.
+   It must NOT contain:
+     - parentheses,
+     - question marks,
+     - explanations,
+     - multiple alternatives.
+   Example:
+     WRONG: "ágynemű (oromáglya?)"
+     CORRECT: "ágynemű"
+4) Create TWO TOTALLY DIFFERENT SHORT ENGLISH EXAMPLE SENTENCES (not from the book) that clearly show this meaning:
+   - The first must use the original surface form exactly as given.
+   - The second must use the lemma form.
+   - Both must use the word with the GIVEN POS.
+
+Details:
+- Focus on the BASE WORD (lemma), not on the specific inflected forms, when deciding meaning.
+- Do NOT reuse or quote the example sentences.
+- The Hungarian expression can be multi-word if that is the most natural dictionary equivalent (e.g. "szerzői jog"), but it must still be clean, without parentheses or explanations.
+- If you are uncertain, choose the single most likely general dictionary meaning.
+- NEVER answer with "Sajnálom", "Nem tudom", "I am sorry", "Sorry" or any similar meta-reply.
+
+VERY IMPORTANT OUTPUT FORMAT (EXACTLY THREE LINES, NO BULLETS, NO EXTRA TEXT):
+Line 1: HU=<ONE_CLEAN_HUNGARIAN_WORD_OR_SHORT_EXPRESSION_WITHOUT_PARENTHESES_OR_EXPLANATIONS>
+Line 2: <one short English sentence containing the surface form>
+Line 3: <one short English sentence containing the lemma>
+
+<ONE_CLEAN_HUNGARIAN_WORD_OR_SHORT_EXPRESSION_WITHOUT_PARENTHESES_OR_EXPLANATIONS> can be ONE or SEVERAL (1-3) Hungarian words.
+
+The POS tag for this word in the book is: {pos_tag}
+Description of this POS tag: {pos_desc}
+Word (lemma): {lemma}
+Surface form (lowercase): {word}
+
+Example sentences from the book:
+{examples}
+
+Line 2 must contain the surface form '{word}', Line 3 must contain the lemma '{lemma}'.
+"""
+
+# Köteges kérés sablonja (ugyanazok a szabályok, JSON kimenettel); a
+# {entries} helyére a BATCH_ENTRY_TEMPLATE szerinti blokkok kerülnek.
+BATCH_PROMPT_TEMPLATE = """
+You are building a bilingual (English -> Hungarian) dictionary for a specific book.
+
+Book / corpus information:
+{book_info}
+
+Each entry below has a fixed part-of-speech (POS) tag, a base English word (lemma),
+the original surface form (lowercase) and several example sentences from the book.
+
+FOR EACH ENTRY, INDEPENDENTLY:
+1) Use the GIVEN POS exactly as provided. Do not guess or select another POS.
+2) Infer the GENERAL DICTIONARY MEANING of the word with this POS (focus on the lemma).
+3) Choose ONE common Hungarian word OR SHORT EXPRESSION (1-3 words) that best matches that meaning and POS.
+   It must be a clean dictionary headword or short phrase ONLY: no parentheses, no question marks,
+   no explanations, no multiple alternatives.
+4) Create TWO TOTALLY DIFFERENT SHORT ENGLISH EXAMPLE SENTENCES (not from the book):
+   - ex_surface must use the original surface form exactly as given,
+   - ex_lemma must use the lemma form,
+   - both must use the word with the GIVEN POS.
+
+- Do NOT reuse or quote the example sentences.
+- If you are uncertain, choose the single most likely general dictionary meaning.
+- NEVER answer with "Sajnálom", "Nem tudom", "I am sorry", "Sorry" or any similar meta-reply.
+
+OUTPUT: a JSON object with an "items" array of one object per entry, in the same order as the entries,
+each with the fields "hu", "ex_surface", "ex_lemma".
+
+There are EXACTLY {count} entries:
+{entries}"""
+
+# ha az utolsó modell glosszája sem megy át a helyesírás-ellenőrzésen, ezzel
+# a kiegészítéssel kérdezzük újra (egyszer)
+SPELL_RETRY_NOTE = """
+NOTE: The previous answer contained a non-Hungarian or misspelled word; return only a valid Hungarian headword.
+"""
+
+BATCH_ENTRY_TEMPLATE = """
+ENTRY {index}:
+POS tag: {pos_desc}
+Word (lemma): {lemma}
+Surface form (lowercase): {word}
+Example sentences from the book:
+{examples}"""
+
 # Token becsléshez globális számlálók
 TOTAL_INPUT_TOKENS = 0
 TOTAL_OUTPUT_TOKENS = 0
 
+# még nem commitolt cache-bejegyzések száma
+CACHE_PENDING = 0
+
+# A kimeneti tokenszám szavankénti mozgóátlaga (EMA) és szórásnégyzete,
+# (modell, köteges-e) szerint külön: a TPM-foglalás a max_output_tokens
+# helyett ebből számol (a 3 soros válasz jóval rövidebb), kötegnél a
+# szavak számával szorozva.
+EMA_INIT = (25.0, 100.0)
+EMA_ALPHA = 0.1
+OUTPUT_EMA: dict[tuple[str, bool], tuple[float, float]] = {}
+
+# Túlfoglalt (végül fel nem használt) TPM tokenek, a következő foglalásokból
+# vonjuk le őket (az AsyncLimiter nem tud visszatéríteni).
+TPM_CREDIT = 0
+
 # tiktoken encoder (OpenAI-féle cl100k_base)
 ENCODING = tiktoken.get_encoding("cl100k_base")
 
@@ -88,20 +300,129 @@ def estimate_tokens(text: str) -> int:
     return len(ENCODING.encode(text))
 
 
+# a sablon fix részének tokenszáma (a behelyettesítendő mezők nélkül)
+TEMPLATE_TOKENS = estimate_tokens(
+    PROMPT_TEMPLATE.format(book_info=BOOK_INFO, pos_tag="", pos_desc="", lemma="", word="", examples="")
+)
+SPELL_RETRY_NOTE_TOKENS = estimate_tokens(SPELL_RETRY_NOTE)
+
+# a promptsablonok lenyomata a cache-kulcshoz: ha bármelyik sablon változik,
+# a régi cache-bejegyzések maguktól érvénytelenné válnak
+PROMPT_TEMPLATE_HASH = hashlib.sha256(
+    "|".join([PROMPT_TEMPLATE, BATCH_PROMPT_TEMPLATE, BATCH_ENTRY_TEMPLATE, SPELL_RETRY_NOTE]).encode("utf-8")
+).hexdigest()
+
+
 def load_chunks():
     """
     chunk_id -> sentence
     (chunks.jsonl-ben: {"id": ..., "sentence": ...})
     """
     chunks = {}
-    with open(CHUNKS_PATH, encoding="utf-8") as f:
+    with open(CHUNKS_PATH, "rb") as f:
         for line in f:
-            rec = json.loads(line)
+            rec = orjson.loads(line)
             cid = rec["id"]
             chunks[cid] = rec["sentence"]
     return chunks
 
 
+def iter_word_recs():
+    """
+    A szóbejegyzések soronként, generátorként (nem tartjuk mind a memóriában).
+    """
+    with open(WORDS_PATH, "rb") as f:
+        for line in f:
+            yield orjson.loads(line)
+
+
+def count_lines(path: str) -> int:
+    """Sorok száma (a haladásjelzéshez és az ETA-hoz)."""
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def open_gloss_cache(path: str) -> sqlite3.Connection:
+    """
+    Perzisztens glossza-cache (SQLite). Kulcs: gloss_cache_key(),
+    érték: magyar glossza + a két angol példamondat.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS gloss ("
+        "key TEXT PRIMARY KEY, hu TEXT, ex_s TEXT, ex_l TEXT)"
+    )
+    return conn
+
+
+def gloss_cache_key(model: str, lemma: str, word: str, pos: str | None, example_sentences) -> str:
+    """
+    Pontos egyezésen alapuló kulcs: ugyanaz a modell, promptsablon, lemma,
+    felszíni alak, POS és példamondat-halmaz -> ugyanaz a prompt, nem kell újra
+    kérdezni a modellt. Ha a sablonok változnak, a régi bejegyzések maguktól
+    érvénytelenné válnak (PROMPT_TEMPLATE_HASH).
+    """
+    raw = "|".join([model, PROMPT_TEMPLATE_HASH, lemma, word, str(pos), *sorted(example_sentences)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def gloss_cache_get(conn: sqlite3.Connection, key: str):
+    """(hu, ex_s, ex_l) vagy None, ha nincs a cache-ben."""
+    return conn.execute(
+        "SELECT hu, ex_s, ex_l FROM gloss WHERE key = ?", (key,)
+    ).fetchone()
+
+
+def gloss_cache_lookup(conn: sqlite3.Connection, entry: dict):
+    """
+    A szó cache-bejegyzése bármelyik modell-lépcsőből (MODEL_TIERS sorrendben):
+    (model, hu, ex_s, ex_l) vagy None, ha egyik modellé sincs a cache-ben.
+    """
+    for model in MODEL_TIERS:
+        cached = gloss_cache_get(conn, entry["cache_keys"][model])
+        if cached is not None:
+            return (model, *cached)
+    return None
+
+
+def gloss_cache_put(conn: sqlite3.Connection, key: str, hu: str, ex_s: str, ex_l: str) -> None:
+    """Beírás a cache-be, CACHE_COMMIT_EVERY bejegyzésenként commit."""
+    global CACHE_PENDING
+
+    conn.execute(
+        "INSERT OR REPLACE INTO gloss (key, hu, ex_s, ex_l) VALUES (?, ?, ?, ?)",
+        (key, hu, ex_s, ex_l),
+    )
+    CACHE_PENDING += 1
+    if CACHE_PENDING >= CACHE_COMMIT_EVERY:
+        conn.commit()
+        CACHE_PENDING = 0
+
+
+def init_speller() -> None:
+    """A magyar hunspell szótár betöltése (a SPELLER globálisba)."""
+    global SPELLER
+    SPELLER = hunspell.HunSpell(HUNSPELL_DIC, HUNSPELL_AFF)
+
+
+@lru_cache(maxsize=100_000)
+def spell_ok(tok_norm: str) -> bool:
+    """Hunspell-ellenőrzés egy (kisbetűs) tokenre, cache-elve."""
+    return SPELLER.spell(tok_norm)
+
+
+def meaning_is_probably_ok_hu(meaning: str) -> bool:
+    """
+    Akkor jó a glossza, ha van legalább egy (betűs) token, és minden token
+    hunspell szerint helyes magyar szó (ugyanaz a szabály, mint a 550-es
+    ellenőrzésben).
+    """
+    tokens = HU_TOKEN_RE.findall(meaning)
+    if not tokens:
+        return False
+    return all(spell_ok(tok.lower()) for tok in tokens)
+
+
 def is_bad_gloss(gloss: str) -> bool:
     """
     Eldöntjük, hogy a glossza nyilvánvalóan rossz-e:
@@ -121,22 +442,11 @@ def is_bad_gloss(gloss: str) -> bool:
     first = g.split()[0]
     lower = first.lower()
 
-    bad_subs = [
-        "sajnálom",
-        "nem tudom",
-        "sorry",
-        "i am sorry",
-        "i'm sorry",
-        "unknown",
-        "nincs",
-        "nem ismert",
-    ]
-    for b in bad_subs:
-        if b in lower:
-            return True
+    if BAD_GLOSS_RE.search(lower):
+        return True
 
     # kezdődjön betűvel (magyar ékezeteket engedjük)
-    if not re.match(r"^[a-záéíóöőúüű]", lower):
+    if not STARTS_WITH_LETTER_RE.match(lower):
         return True
 
     # legyen épkézláb hossz (max ~20 karakter az ELSŐ szóra)
@@ -146,46 +456,125 @@ def is_bad_gloss(gloss: str) -> bool:
     return False
 
 
-def call_openai(
+def get_output_reservation(model: str, batched: bool, n_words: int, max_output_tokens: int) -> int:
+    """A TPM-foglalás kimeneti része: min(max, ceil(n_words * (EMA + 2*szórás)))."""
+    mean, var = OUTPUT_EMA.get((model, batched), EMA_INIT)
+    return min(max_output_tokens, math.ceil(n_words * (mean + 2 * math.sqrt(var))))
+
+
+def update_output_ema(model: str, batched: bool, n_words: int, output_tokens: int) -> None:
+    """A (model, batched) szavankénti EMA-jának és szórásnégyzetének frissítése."""
+    mean, var = OUTPUT_EMA.get((model, batched), EMA_INIT)
+    diff = output_tokens / n_words - mean
+    mean += EMA_ALPHA * diff
+    var = (1 - EMA_ALPHA) * (var + EMA_ALPHA * diff * diff)
+    OUTPUT_EMA[(model, batched)] = (mean, var)
+
+
+async def acquire_tpm(tokens: int) -> None:
+    """TPM tokenek lefoglalása, elsőként a korábbi túlfoglalásból (TPM_CREDIT)."""
+    global TPM_CREDIT
+
+    from_credit = min(TPM_CREDIT, tokens)
+    TPM_CREDIT -= from_credit
+    tokens -= from_credit
+    if tokens > 0:
+        await TPM_LIMITER.acquire(min(tokens, MAX_TPM))
+
+
+def response_request_body(
+        model: str,
+        prompt: str,
+        max_output_tokens: int = 50,
+        text_format: dict | None = None,
+) -> dict:
+    """
+    A Responses API kérés paraméterei – közös a közvetlen hívásnak és a
+    Batch API bemeneti fájljának. text_format: strukturált kimenet (JSON séma).
+    """
+    text = {"verbosity": "low"}  # ne magyarázzon hosszan
+    if text_format is not None:
+        text["format"] = text_format
+
+    return {
+        "model": model,
+        "input": prompt,
+        "max_output_tokens": max_output_tokens,
+        "reasoning": {"effort": "minimal"},
+        "text": text,
+    }
+
+
+async def call_openai(
         model: str,
         prompt: str,
         max_output_tokens: int = 50,
+        input_tokens_est: int | None = None,
+        text_format: dict | None = None,
+        n_words: int = 1,
 ) -> Tuple[str, int, int]:
     """
-    LLM-hívás OpenAI Responses API-val (gpt-5 / gpt-5-mini).
+    LLM-hívás OpenAI Responses API-val (gpt-5 / gpt-5-mini), aszinkron.
 
     - max_output_tokens alapból 50 (rövid, 3 soros outputhoz elég).
     - reasoning.effort = "minimal", hogy ne égjen el minden reasoningre.
+    - n_words: hány szó van a kérésben (köteges hívásnál a TPM-foglaláshoz).
 
     Visszaad:
       - content (string)
       - input_tokens
       - output_tokens
 
-    Ha HTTP hiba van (pl. 400), kiírja a teljes response-t.
+    Átmeneti hibánál (429, 5xx, kapcsolati hiba) várakozás után újrapróbálja
+    (max. MAX_ATTEMPTS-szor, a Retry-After fejlécet is figyelembe véve).
+    Egyéb HTTP hibánál (pl. 400) kiírja a teljes response-t.
     """
 
-    global TOTAL_INPUT_TOKENS, TOTAL_OUTPUT_TOKENS
+    global TOTAL_INPUT_TOKENS, TOTAL_OUTPUT_TOKENS, TPM_CREDIT
 
-    # input token becslés fallbacknek
-    input_tokens_est = estimate_tokens(prompt)
+    # input token becslés fallbacknek és a TPM-foglaláshoz
+    # (ha a hívó nem adta meg előre kiszámolva)
+    if input_tokens_est is None:
+        input_tokens_est = estimate_tokens(prompt)
 
-    try:
-        resp = client.responses.create(
-            model=model,
-            input=prompt,
-            max_output_tokens=max_output_tokens,
-            reasoning={"effort": "minimal"},
-            text={"verbosity": "low"}  # ne magyarázzon hosszan
-        )
-    except APIStatusError as e:
-        print("OpenAI API error status code:", e.status_code)
+    # rate limit: 1 kérés + a becsült tokenszám lefoglalása
+    batched = text_format is not None
+    reserved_tokens = input_tokens_est + get_output_reservation(model, batched, n_words, max_output_tokens)
+    await acquire_tpm(reserved_tokens)
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        await RPM_LIMITER.acquire(1)
         try:
-            print("OpenAI API raw response:")
-            print(e.response)
-        except Exception:
-            print("OpenAI API response could not be printed safely.")
-        raise
+            resp = await client.responses.create(
+                **response_request_body(model, prompt, max_output_tokens, text_format)
+            )
+            break
+        except (APIStatusError, APIConnectionError) as e:
+            status_code = getattr(e, "status_code", None)
+            transient = isinstance(e, APIConnectionError) or status_code in RETRY_STATUS_CODES
+            if transient and attempt < MAX_ATTEMPTS:
+                delay = min(RETRY_MAX_DELAY, 2 ** attempt) + random.random()
+                retry_after = e.response.headers.get("retry-after") if isinstance(e, APIStatusError) else None
+                if retry_after:
+                    try:
+                        delay = float(retry_after)
+                    except ValueError:
+                        pass
+                print(
+                    f"OpenAI API error ({status_code or type(e).__name__}), "
+                    f"retry {attempt}/{MAX_ATTEMPTS - 1} in {delay:.1f}s",
+                    flush=True,
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            print("OpenAI API error status code:", status_code)
+            try:
+                print("OpenAI API raw response:")
+                print(getattr(e, "response", None))
+            except Exception:
+                print("OpenAI API response could not be printed safely.")
+            raise
 
     # Egyszerű szövegkimenet (összefűzi az összes text chunkot)
     content = getattr(resp, "output_text", None) or ""
@@ -213,6 +602,16 @@ def call_openai(
     TOTAL_INPUT_TOKENS += input_tokens
     TOTAL_OUTPUT_TOKENS += output_tokens
 
+    update_output_ema(model, batched, n_words, output_tokens)
+
+    # ha a tényleges felhasználás több volt a foglaltnál, a különbséget is
+    # levonjuk; ha kevesebb, a maradék jóváírás (max. egy percnyi keret)
+    overuse = input_tokens + output_tokens - reserved_tokens
+    if overuse > 0:
+        await acquire_tpm(overuse)
+    else:
+        TPM_CREDIT = min(TPM_CREDIT - overuse, MAX_TPM)
+
     return content, input_tokens, output_tokens
 
 
@@ -223,7 +622,7 @@ def parse_gloss_line(line: str) -> str:
     POS-t már NEM várunk és nem is használjuk.
     """
     s = line.strip()
-    m_hu = re.search(r"HU\s*[:=]\s*([^;]+)", s)
+    m_hu = HU_RE.search(s)
     if m_hu:
         return m_hu.group(1).strip()
     # ha nem tartotta be a formát, vegyük az egész sort
@@ -244,97 +643,55 @@ def parse_example_lemma_en(line: str) -> str:
     return line.strip()
 
 
-def generate_hungarian_gloss_for_lemma(
-        lemma: str,
-        word: str,
-        pos: str | None,
-        example_sentences,
-):
-    """
-    Egy LLM-hívás LEMMA+POS szinten:
-      - fix POS tag az adott bejegyzéshez (spaCy-től)
-      - néhány példamondat a könyvből
-
-    Kimenet:
-      - magyar címszó vagy rövid kifejezés (1-3 szó)
-      - 2 rövid angol példamondat:
-          * example_surface_en: az eredeti word alakot használva
-          * example_lemma_en: a lemma alakot használva
-
-    Plusz:
-      - input / output token szám az adott hívásra (API usage alapján, ha van).
-    """
+def pos_prompt_parts(pos: str | None) -> tuple[str, str]:
+    """(POS tag, POS leírás) a prompthoz."""
     if pos:
         pos_desc = POS_DESC_EN.get(pos, "a part of speech")
-        pos_desc_line = f"{pos} - {pos_desc}"
-        pos_tag_for_output = pos
-    else:
-        pos_desc_line = "unknown (the model must infer it from the examples)"
-        pos_tag_for_output = "unknown"
+        return pos, f"{pos} - {pos_desc}"
+    return "unknown", "unknown (the model must infer it from the examples)"
 
+
+def format_examples(example_sentences) -> str:
+    """Számozott példamondat-lista a prompthoz."""
     examples_block = ""
     for i, s in enumerate(example_sentences, start=1):
         examples_block += f"{i}. {s}\n"
+    return examples_block
 
-    prompt = f"""
-You are building a bilingual (English -> Hungarian) dictionary for a specific book.
-
-Book / corpus information:
-{BOOK_INFO}
-
-I will give you:
-- a base English word (lemma)
-- the original surface form (lowercase)
-- one fixed part-of-speech (POS) tag for this word in the book
-- several example sentences from the book where this word appears (in various forms)
 
-YOUR JOB:
-1) Use the GIVEN POS exactly as provided. Do not guess or select another POS.
-2) Infer the GENERAL DICTIONARY MEANING of the word with this POS.
-3) Choose ONE common Hungarian word OR SHORT EXPRESSION (1-3 words) that best matches that meaning and POS.
-   IMPORTANT: the Hungarian expression must be a clean dictionary headword or short phrase ONLY.
-   It must NOT contain:
-     - parentheses,
-     - question marks,
-     - explanations,
-     - multiple alternatives.
-   Example:
-     WRONG: "ágynemű (oromáglya?)"
-     CORRECT: "ágynemű"
-4) Create TWO TOTALLY DIFFERENT SHORT ENGLISH EXAMPLE SENTENCES (not from the book) that clearly show this meaning:
-   - The first must use the original surface form exactly as given.
-   - The second must use the lemma form.
-   - Both must use the word with the GIVEN POS.
-
-Details:
-- Focus on the BASE WORD (lemma), not on the specific inflected forms, when deciding meaning.
-- The POS tag for this word in the book is: {pos_tag_for_output}
-- Description of this POS tag: {pos_desc_line}
-- Do NOT reuse or quote the example sentences.
-- The Hungarian expression can be multi-word if that is the most natural dictionary equivalent (e.g. "szerzői jog"), but it must still be clean, without parentheses or explanations.
-- If you are uncertain, choose the single most likely general dictionary meaning.
-- NEVER answer with "Sajnálom", "Nem tudom", "I am sorry", "Sorry" or any similar meta-reply.
-
-Word (lemma): {lemma}
-Surface form (lowercase): {word}
-
-Example sentences from the book:
-{examples_block}
+def build_prompt(lemma: str, word: str, pos: str | None, example_sentences) -> str:
+    """
+    A prompt egy szóhoz (LEMMA+POS szinten), a PROMPT_TEMPLATE kitöltésével.
+    """
+    pos_tag, pos_desc = pos_prompt_parts(pos)
+    return PROMPT_TEMPLATE.format(
+        book_info=BOOK_INFO,
+        pos_tag=pos_tag,
+        pos_desc=pos_desc,
+        lemma=lemma,
+        word=word,
+        examples=format_examples(example_sentences),
+    )
 
-VERY IMPORTANT OUTPUT FORMAT (EXACTLY THREE LINES, NO BULLETS, NO EXTRA TEXT):
-Line 1: HU=<ONE_CLEAN_HUNGARIAN_WORD_OR_SHORT_EXPRESSION_WITHOUT_PARENTHESES_OR_EXPLANATIONS>
-Line 2: <one short English sentence containing the surface form '{word}'>
-Line 3: <one short English sentence containing the lemma '{lemma}'>
 
-<ONE_CLEAN_HUNGARIAN_WORD_OR_SHORT_EXPRESSION_WITHOUT_PARENTHESES_OR_EXPLANATIONS> can be ONE or SEVERAL (1-3) Hungarian words.
-"""
+def estimate_prompt_tokens(lemma: str, word: str, pos: str | None, example_sentences) -> int:
+    """
+    A build_prompt() promptjának becsült tokenszáma: a sablon fix része előre
+    kiszámolva (TEMPLATE_TOKENS), csak a behelyettesített részeket tokenizáljuk,
+    egyetlen encode_batch hívással. (A határokon eltérhet pár tokennel.)
+    """
+    pos_tag, pos_desc = pos_prompt_parts(pos)
+    # lemma és word kétszer szerepel a sablonban (a mezőknél és a Line 2/3 utasításban)
+    parts = [pos_tag, pos_desc, lemma, lemma, word, word, format_examples(example_sentences)]
+    return TEMPLATE_TOKENS + sum(len(t) for t in ENCODING.encode_batch(parts))
 
-    raw, input_tokens, output_tokens = call_openai(
-        MODEL_NAME_GLOSS,
-        prompt,
-        max_output_tokens=50,
-    )
 
+def parse_gloss_response(raw: str) -> tuple[str, str, str]:
+    """
+    A 3 soros válasz feldolgozása.
+    Visszaad: (hu_word, example_surface_en, example_lemma_en);
+    ValueError, ha üres vagy nyilvánvalóan rossz a glossza.
+    """
     lines = [ln.strip() for ln in raw.splitlines() if ln.strip()]
 
     if not lines:
@@ -353,7 +710,134 @@ Line 3: <one short English sentence containing the lemma '{lemma}'>
             f"bad gloss from main model: {hu_word!r} (raw first line: {first_line!r})"
         )
 
-    return hu_word, example_surface_en, example_lemma_en, input_tokens, output_tokens
+    return hu_word, example_surface_en, example_lemma_en
+
+
+async def generate_hungarian_gloss_for_lemma(
+        lemma: str,
+        word: str,
+        pos: str | None,
+        example_sentences,
+        models=MODEL_TIERS,
+):
+    """
+    Egy LLM-hívás LEMMA+POS szinten:
+      - fix POS tag az adott bejegyzéshez (spaCy-től)
+      - néhány példamondat a könyvből
+
+    Kimenet:
+      - magyar címszó vagy rövid kifejezés (1-3 szó)
+      - 2 rövid angol példamondat:
+          * example_surface_en: az eredeti word alakot használva
+          * example_lemma_en: a lemma alakot használva
+
+    A models (alapból MODEL_TIERS) modelljeit sorban próbáljuk, amíg használható
+    választ nem kapunk. Ha az utolsó modell glosszája sem megy át a
+    helyesírás-ellenőrzésen, egyszer még megkérdezzük SPELL_RETRY_NOTE-tal;
+    ha ez sem segít, a választ így is visszaadjuk (a kimenetben ok: false lesz).
+
+    Plusz:
+      - input / output token szám (az összes próbálkozásra, API usage alapján, ha van)
+      - a modell neve, amelyik a választ adta.
+    """
+    prompt = build_prompt(lemma, word, pos, example_sentences)
+    prompt_tokens_est = estimate_prompt_tokens(lemma, word, pos, example_sentences)
+
+    input_tokens = 0
+    output_tokens = 0
+
+    for tier, model in enumerate(models, start=1):
+        is_last = tier == len(models)
+        try:
+            raw, in_tok, out_tok = await call_openai(
+                model,
+                prompt,
+                max_output_tokens=50,
+                input_tokens_est=prompt_tokens_est,
+            )
+            input_tokens += in_tok
+            output_tokens += out_tok
+            hu_word, example_surface_en, example_lemma_en = parse_gloss_response(raw)
+        except ValueError as e:
+            if is_last:
+                raise
+            print(f"    {model}: {e} -> escalating", flush=True)
+            continue
+
+        if meaning_is_probably_ok_hu(hu_word):
+            return hu_word, example_surface_en, example_lemma_en, input_tokens, output_tokens, model
+
+        if not is_last:
+            print(f"    {model}: '{hu_word}' failed the spell check -> escalating", flush=True)
+            continue
+
+        print(f"    {model}: '{hu_word}' failed the spell check -> retrying with a stricter prompt", flush=True)
+        try:
+            raw, in_tok, out_tok = await call_openai(
+                model,
+                prompt + SPELL_RETRY_NOTE,
+                max_output_tokens=50,
+                input_tokens_est=prompt_tokens_est + SPELL_RETRY_NOTE_TOKENS,
+            )
+            input_tokens += in_tok
+            output_tokens += out_tok
+            hu_word, example_surface_en, example_lemma_en = parse_gloss_response(raw)
+        except ValueError as e:
+            # marad az előző (helyesírásilag gyanús) válasz
+            print(f"    {model}: {e} on the stricter retry", flush=True)
+        return hu_word, example_surface_en, example_lemma_en, input_tokens, output_tokens, model
+
+
+async def generate_glosses_batch(entries: list[dict], model: str = MODEL_TIERS[0]):
+    """
+    Több szó egyetlen kérésben (alapból MODEL_TIERS[0] modellel), JSON sémás kimenettel.
+
+    Visszaad: (results, input_tokens, output_tokens), ahol results[i] a
+    (hu_word, example_surface_en, example_lemma_en, model) négyes, vagy None, ha az
+    adott elem rossz vagy nem megy át a helyesírás-ellenőrzésen (ezeket a
+    hívó szavanként, a drágább modellel kérdezi újra).
+    ValueError, ha a válasz nem értelmezhető vagy az elemszám nem egyezik.
+    """
+    blocks = []
+    for i, e in enumerate(entries, start=1):
+        _, pos_desc = pos_prompt_parts(e["pos"])
+        blocks.append(BATCH_ENTRY_TEMPLATE.format(
+            index=i,
+            pos_desc=pos_desc,
+            lemma=e["lemma"],
+            word=e["word"],
+            examples=format_examples(e["example_sentences"]),
+        ))
+    prompt = BATCH_PROMPT_TEMPLATE.format(
+        book_info=BOOK_INFO,
+        count=len(entries),
+        entries="".join(blocks),
+    )
+
+    raw, input_tokens, output_tokens = await call_openai(
+        model,
+        prompt,
+        max_output_tokens=50 * len(entries) + 20,
+        text_format=BATCH_RESPONSE_FORMAT,
+        n_words=len(entries),
+    )
+
+    try:
+        items = orjson.loads(raw)["items"]
+    except (orjson.JSONDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"unparsable batch answer: {e}") from e
+    if len(items) != len(entries):
+        raise ValueError(f"batch answer has {len(items)} items for {len(entries)} entries")
+
+    results = []
+    for item in items:
+        hu_word = item["hu"].strip()
+        if is_bad_gloss(hu_word) or not meaning_is_probably_ok_hu(hu_word):
+            results.append(None)
+        else:
+            results.append((hu_word, item["ex_surface"].strip(), item["ex_lemma"].strip(), model))
+
+    return results, input_tokens, output_tokens
 
 
 def format_eta(seconds: int) -> str:
@@ -368,110 +852,416 @@ def format_eta(seconds: int) -> str:
     return f"{h:02d}:{m:02d}:{s:02d}"
 
 
-def main():
-    out_dir = os.path.dirname(OUTPUT_PATH)
-    if out_dir:
-        os.makedirs(out_dir, exist_ok=True)
-
-    print("Loading chunks (sentences)...")
-    chunks = load_chunks()
-    print(f"Loaded {len(chunks)} sentences from {CHUNKS_PATH}")
-
-    # beolvassuk az összes szót, hogy tudjuk a total-t
-    with open(WORDS_PATH, encoding="utf-8") as f_in:
-        word_recs = [json.loads(line) for line in f_in]
-
-    total_words = len(word_recs)
-    print(f"Loaded {total_words} word entries from {WORDS_PATH}")
-    print(f"MAX_EXAMPLES_PER_WORD = {MAX_EXAMPLES_PER_WORD}")
-
-    written = 0
-    start_time = time.time()  # indulási idő az ETA-hoz
+def select_example_ids(ctx_ids, chunks) -> list:
+    """
+    Max MAX_EXAMPLES_PER_WORD létező példamondat-azonosító, egyetlen menetben
+    és O(N) memóriával (a szűrt listát nem építjük fel):
+      - ha legfeljebb N érvényes van, mind, az eredeti sorrendben;
+      - különben a N legrövidebb mondat (azonos hossznál a kisebb id).
+    """
+    valid = (cid for cid in ctx_ids if cid in chunks)
+    if MAX_EXAMPLES_PER_WORD is None:
+        return list(valid)
+
+    head = list(itertools.islice(valid, MAX_EXAMPLES_PER_WORD))
+    nxt = next(valid, None)
+    if nxt is None:
+        return head
+    return heapq.nsmallest(
+        MAX_EXAMPLES_PER_WORD,
+        itertools.chain(head, (nxt,), valid),
+        key=lambda cid: (len(chunks[cid]), cid),
+    )
 
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as f_out:
-        for w_idx, rec in enumerate(word_recs, start=1):
-            word = rec["word"]                 # felszíni forma (lowercase)
-            lemma = rec.get("lemma") or word   # lemma
-            pos = rec.get("pos")               # fixed POS (STRING, spaCy-től)
-            ctx_ids = rec["contexts"]          # mondat-azonosítók
 
-            total_ctx_for_word = len(ctx_ids)
+def prepare_word(rec: dict, chunks):
+    """
+    Egy szóbejegyzés előkészítése: példamondatok kiválasztása.
+    Visszaad: a szó adatait (dict), vagy None, ha nincs használható kontextus.
+    """
+    word = rec["word"]                 # felszíni forma (lowercase)
+    lemma = rec.get("lemma") or word   # lemma
+    pos = rec.get("pos")               # fixed POS (STRING, spaCy-től)
+    ctx_ids = rec["contexts"]          # mondat-azonosítók
+
+    # max N példamondat: a legrövidebbek (azonos hossznál a kisebb id), így
+    # futásról futásra ugyanaz a prompt (cache-találat helyben és az OpenAI-nál is)
+    selected_ids = select_example_ids(ctx_ids, chunks)
+    if not selected_ids:
+        return None
+
+    example_sentences = [chunks[cid] for cid in selected_ids]
+
+    return {
+        "word": word,
+        "lemma": lemma,
+        "pos": pos,
+        "example_sentences": example_sentences,
+        "total_ctx": len(ctx_ids),
+        # modellenként külön kulcs: a cache-be az a modell kerül, amelyik a választ adta
+        "cache_keys": {
+            model: gloss_cache_key(model, lemma, word, pos, example_sentences) for model in MODEL_TIERS
+        },
+    }
+
+
+def build_out_rec(entry: dict, model: str, gloss_hu: str, ex_surface: str, ex_lemma: str) -> dict:
+    """A kimeneti sor egy szóhoz."""
+    pos = entry["pos"]
+    pos_hu = POS_MAP_HU.get(pos, "") if pos else ""
+
+    return {
+        "word": entry["word"],
+        "lemma": entry["lemma"],
+        "pos": pos,                     # spaCy POS tag (STRING)
+        "pos_hu": pos_hu,               # magyar megnevezés (STRING)
+        "meaning_hu": gloss_hu,         # magyar alapszó vagy több szavas kifejezés
+        "example_surface_en": ex_surface,  # felszíni alakos példamondat
+        "example_lemma_en": ex_lemma,      # lemma-alakos példamondat
+        "model": model,                 # a választ adó modell (a 600-as ezt írja ki)
+        # csak a hunspell szerint is helyes glossza "ok" (a 550-es ellenőrzés szabálya)
+        "ok": gloss_hu != "" and meaning_is_probably_ok_hu(gloss_hu),
+    }
+
+
+async def process_batch(cache: sqlite3.Connection, batch, total_words: int, chunks):
+    """
+    Egy szóköteg feldolgozása: a cache-ben lévő szavakat onnan vesszük, a
+    többit egyetlen köteges (JSON kimenetű) hívással kérdezzük. Ha a köteges
+    válasz nem használható, vagy egy-egy eleme rossz, az érintett szavakat
+    egyenként kérdezzük újra.
 
-            # véletlenül kiválasztunk max N példamondatot kontextusnak
-            valid_ids = [cid for cid in ctx_ids if cid in chunks]
-            if not valid_ids:
-                print(
-                    f"[word {w_idx}/{total_words}] '{word}' - SKIP: no valid contexts found"
-                )
-                continue
+    Visszaad: (word, out_rec, status, input_tokens, output_tokens) listát;
+    out_rec None, ha a szót kihagyjuk.
+    """
+    results = []
+    misses = []  # (results-index, entry)
+
+    for w_idx, rec in batch:
+        entry = prepare_word(rec, chunks)
+        if entry is None:
+            results.append((rec["word"], None, "SKIP: no valid contexts found", 0, 0))
+            continue
+
+        print(
+            f"\n=== WORD {w_idx}/{total_words}: '{entry['word']}' "
+            f"(lemma='{entry['lemma']}', pos='{entry['pos']}', "
+            f"{len(entry['example_sentences'])}/{entry['total_ctx']} example sentences used) ===",
+            flush=True,
+        )
 
-            if MAX_EXAMPLES_PER_WORD is not None and len(valid_ids) > MAX_EXAMPLES_PER_WORD:
-                selected_ids = random.sample(valid_ids, MAX_EXAMPLES_PER_WORD)
-            else:
-                selected_ids = list(valid_ids)
+        cached = gloss_cache_lookup(cache, entry)
+        if cached is not None:
+            results.append((entry["word"], build_out_rec(entry, *cached), f"OK (cache, {cached[0]})", 0, 0))
+            continue
 
-            example_sentences = [chunks[cid] for cid in selected_ids]
+        misses.append((len(results), entry))
+        results.append(None)
 
-            print(
-                f"\n=== WORD {w_idx}/{total_words}: '{word}' "
-                f"(lemma='{lemma}', pos='{pos}', {len(selected_ids)}/{total_ctx_for_word} example sentences used) ===",
-                flush=True,
+    batch_answers = [None] * len(misses)
+    batch_in = batch_out = 0
+    # ha a köteges hívás már lefutott, a szavankénti újrapróbálás a drágább modell(ek)kel megy
+    fallback_models = MODEL_TIERS
+    if len(misses) > 1:
+        try:
+            batch_answers, input_tokens, output_tokens = await generate_glosses_batch(
+                [entry for _, entry in misses], MODEL_TIERS[0]
             )
-
-            input_tokens = 0
-            output_tokens = 0
-
+            # a köteg tokenjeit a szavak között egyenlően osztjuk szét (csak kiíráshoz)
+            batch_in = input_tokens // len(misses)
+            batch_out = output_tokens // len(misses)
+            fallback_models = MODEL_TIERS[1:] or MODEL_TIERS
+        except Exception as e:
+            print(f"Batch of {len(misses)} words failed ({e}), falling back to single-word calls", flush=True)
+
+    for (res_idx, entry), answer in zip(misses, batch_answers):
+        input_tokens = batch_in
+        output_tokens = batch_out
+        if answer is not None:
+            gloss_hu, ex_surface, ex_lemma, model = answer
+            status = f"OK ({model}, batch)"
+        else:
             try:
-                gloss_hu, ex_surface, ex_lemma, input_tokens, output_tokens = generate_hungarian_gloss_for_lemma(
-                    lemma=lemma,
-                    word=word,
-                    pos=pos,
-                    example_sentences=example_sentences,
+                gloss_hu, ex_surface, ex_lemma, in_tok, out_tok, model = await generate_hungarian_gloss_for_lemma(
+                    lemma=entry["lemma"],
+                    word=entry["word"],
+                    pos=entry["pos"],
+                    example_sentences=entry["example_sentences"],
+                    models=fallback_models,
                 )
-                status = "OK"
+                input_tokens += in_tok
+                output_tokens += out_tok
+                status = f"OK ({model})"
             except Exception as e:
                 gloss_hu = ""
                 ex_surface = ""
                 ex_lemma = ""
+                model = fallback_models[-1]
                 status = f"ERROR: {e}"
 
-            pos_hu = POS_MAP_HU.get(pos, "") if pos else ""
-
-            out_rec = {
-                "word": word,
-                "lemma": lemma,
-                "pos": pos,                     # spaCy POS tag (STRING)
-                "pos_hu": pos_hu,               # magyar megnevezés (STRING)
-                "meaning_hu": gloss_hu,         # magyar alapszó vagy több szavas kifejezés
-                "example_surface_en": ex_surface,  # felszíni alakos példamondat
-                "example_lemma_en": ex_lemma,      # lemma-alakos példamondat
-                "ok": gloss_hu != "",
-            }
+        out_rec = build_out_rec(entry, model, gloss_hu, ex_surface, ex_lemma)
+        # a helyesírásilag hibás glosszát nem cache-eljük: a következő futás újrapróbálja
+        if out_rec["ok"]:
+            gloss_cache_put(cache, entry["cache_keys"][model], gloss_hu, ex_surface, ex_lemma)
+        elif gloss_hu:
+            status += " [failed spell check]"
+        results[res_idx] = (entry["word"], out_rec, status, input_tokens, output_tokens)
+
+    return results
+
 
-            f_out.write(json.dumps(out_rec, ensure_ascii=False) + "\n")
+async def generate_all(word_recs, total_words: int, chunks, cache: sqlite3.Connection, f_out) -> int:
+    """
+    A szavakat GLOSS_BATCH_SIZE méretű kötegekben OPENAI_CONCURRENCY párhuzamos
+    worker dolgozza fel (a közös AsyncOpenAI klienssel), az eredményeket egyetlen író coroutine írja ki.
+    A kötegek tetszőleges sorrendben készülhetnek el; az író a korábban
+    befejezetteket a szó indexe (w_idx) szerint visszatartja, így a kimenet a
+    bemenet sorrendjében készül, futásról futásra ugyanúgy.
+
+    Visszaad: a kiírt bejegyzések száma.
+    """
+    work_queue = asyncio.Queue(maxsize=OPENAI_CONCURRENCY * 2)
+    result_queue = asyncio.Queue()
+    start_time = time.time()  # indulási idő az ETA-hoz
+    written = 0
+
+    async def producer():
+        items = enumerate(word_recs, start=1)
+        while batch := list(itertools.islice(items, GLOSS_BATCH_SIZE)):
+            await work_queue.put(batch)
+        for _ in range(OPENAI_CONCURRENCY):
+            await work_queue.put(None)
+
+    async def worker():
+        while True:
+            batch = await work_queue.get()
+            if batch is None:
+                return
+            results = await process_batch(cache, batch, total_words, chunks)
+            # a process_batch a köteg minden szavára pontosan egy eredményt ad, sorrendben
+            for (w_idx, _), result in zip(batch, results):
+                await result_queue.put((w_idx, result))
+
+    async def writer() -> int:
+        # w_idx -> eredmény: a sorrendből előre futó (még nem írható) eredmények
+        pending = {}
+        next_idx = 1
+        while True:
+            item = await result_queue.get()
+            if item is None:
+                return written
+            w_idx, result = item
+            pending[w_idx] = result
+            while next_idx in pending:
+                write_result(next_idx, pending.pop(next_idx))
+                next_idx += 1
+
+    def write_result(done: int, result) -> None:
+        nonlocal written
+        word, out_rec, status, input_tokens, output_tokens = result
+
+        if out_rec is None:
+            print(f"[word {done}/{total_words}] '{word}' - {status}")
+            return
+
+        f_out.write(orjson.dumps(out_rec) + b"\n")
+        written += 1
+        if written % OUTPUT_FLUSH_EVERY == 0:
             f_out.flush()
-            written += 1
 
-            # ETA számolás
-            elapsed = time.time() - start_time
-            avg_per_word = elapsed / w_idx
-            remaining_words = total_words - w_idx
-            eta_seconds = int(remaining_words * avg_per_word)
-            eta_str = format_eta(eta_seconds)
-
-            print(
-                f"[word {w_idx}/{total_words}] '{word}' -> {status} "
-                f"(HU='{gloss_hu}', tokens in={input_tokens}, out={output_tokens})",
-                flush=True,
-            )
-            print(
-                f"    Elapsed: {format_eta(int(elapsed))}, "
-                f"ETA remaining: {eta_str}",
-                flush=True,
+        # ETA számolás (a befejezett szavak alapján)
+        elapsed = time.time() - start_time
+        avg_per_word = elapsed / done
+        remaining_words = total_words - done
+        eta_seconds = int(remaining_words * avg_per_word)
+        eta_str = format_eta(eta_seconds)
+
+        print(
+            f"[word {done}/{total_words}] '{word}' -> {status} "
+            f"(HU='{out_rec['meaning_hu']}', tokens in={input_tokens}, out={output_tokens})",
+            flush=True,
+        )
+        print(
+            f"    Elapsed: {format_eta(int(elapsed))}, "
+            f"ETA remaining: {eta_str}",
+            flush=True,
+        )
+
+    writer_task = asyncio.create_task(writer())
+    await asyncio.gather(
+        producer(),
+        *(worker() for _ in range(OPENAI_CONCURRENCY)),
+    )
+    await result_queue.put(None)
+    return await writer_task
+
+
+def response_output_text(body: dict) -> str:
+    """
+    A Responses API válasz (JSON) szöveges kimenete – a Batch API eredményfájlban
+    nincs output_text mező, az üzenetek output_text részeit fűzzük össze.
+    """
+    parts = []
+    for item in body.get("output") or []:
+        if item.get("type") != "message":
+            continue
+        for c in item.get("content") or []:
+            if c.get("type") == "output_text":
+                parts.append(c.get("text", ""))
+    return "".join(parts)
+
+
+async def generate_all_batch_api(word_recs, total_words: int, chunks, cache: sqlite3.Connection, output_path: str) -> int:
+    """
+    Batch API mód: az összes promptot egy JSONL fájlba írjuk (custom_id =
+    "word-<index>"), feltöltjük, elindítjuk a batch-et, BATCH_POLL_SECONDS
+    másodpercenként lekérdezzük az állapotát, végül az eredményfájlt
+    ugyanazzal a parse_gloss_response-szal dolgozzuk fel. A cache-ben már
+    meglévő szavak nem kerülnek a batch-be.
+
+    Az output_path-t csak a sikeres batch után nyitjuk meg: ha a batch elhasal
+    (vagy lejár), az előző futás kimenete érintetlen marad.
+
+    Visszaad: a kiírt bejegyzések száma.
+    """
+    entries = {}  # custom_id -> entry
+    # custom_id -> (model, gloss_hu, ex_surface, ex_lemma, status)
+    results = {}
+
+    with open(BATCH_INPUT_PATH, "wb") as f_batch:
+        for w_idx, rec in enumerate(word_recs, start=1):
+            entry = prepare_word(rec, chunks)
+            if entry is None:
+                print(f"[word {w_idx}/{total_words}] '{rec['word']}' - SKIP: no valid contexts found")
+                continue
+            custom_id = f"word-{w_idx}"
+            entries[custom_id] = entry
+            cached = gloss_cache_lookup(cache, entry)
+            if cached is not None:
+                results[custom_id] = (*cached, "OK (cache)")
+                continue
+            prompt = build_prompt(entry["lemma"], entry["word"], entry["pos"], entry["example_sentences"])
+            req = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": response_request_body(MODEL_NAME_GLOSS, prompt, max_output_tokens=50),
+            }
+            f_batch.write(orjson.dumps(req) + b"\n")
+
+    n_requests = len(entries) - len(results)
+    print(f"Wrote {n_requests} batch requests to {BATCH_INPUT_PATH} ({len(results)} cached)")
+    if n_requests:
+        await run_batch(cache, entries, results)
+
+    # a bemenet sorrendjében írunk; ami nincs az eredményben, az hibás
+    written = 0
+    with open(output_path, "wb", buffering=OUTPUT_BUFFER_SIZE) as f_out:
+        for custom_id, entry in entries.items():
+            model, gloss_hu, ex_surface, ex_lemma, status = results.get(
+                custom_id, (MODEL_NAME_GLOSS, "", "", "", "ERROR: missing from batch output")
             )
+            out_rec = build_out_rec(entry, model, gloss_hu, ex_surface, ex_lemma)
+            f_out.write(orjson.dumps(out_rec) + b"\n")
+            written += 1
+            print(f"[{custom_id}] '{entry['word']}' -> {status} (HU='{gloss_hu}')")
+
+    return written
+
+
+async def run_batch(cache: sqlite3.Connection, entries: dict, results: dict) -> None:
+    """
+    A BATCH_INPUT_PATH feltöltése, a batch elindítása és kivárása, majd az
+    eredmények beírása a results dict-be (és a cache-be).
+    """
+    global TOTAL_INPUT_TOKENS, TOTAL_OUTPUT_TOKENS
+
+    with open(BATCH_INPUT_PATH, "rb") as f_batch:
+        batch_file = await client.files.create(file=f_batch, purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/responses",
+        completion_window="24h",
+    )
+    print(f"Batch created: {batch.id}")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        batch = await client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        done = f"{counts.completed}/{counts.total}" if counts else "?"
+        print(f"Batch {batch.id}: {batch.status} ({done} done)", flush=True)
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"batch {batch.id} ended with status {batch.status}")
+
+    content = await client.files.content(batch.output_file_id)
+    for line in content.text.splitlines():
+        if not line.strip():
+            continue
+        item = orjson.loads(line)
+        custom_id = item["custom_id"]
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            error = item.get("error") or response.get("body", {}).get("error")
+            results[custom_id] = (MODEL_NAME_GLOSS, "", "", "", f"ERROR: {error}")
+            continue
+
+        body = response["body"]
+        usage = body.get("usage") or {}
+        TOTAL_INPUT_TOKENS += usage.get("input_tokens", 0)
+        TOTAL_OUTPUT_TOKENS += usage.get("output_tokens", 0)
+        try:
+            gloss_hu, ex_surface, ex_lemma = parse_gloss_response(response_output_text(body))
+            if meaning_is_probably_ok_hu(gloss_hu):
+                results[custom_id] = (MODEL_NAME_GLOSS, gloss_hu, ex_surface, ex_lemma, "OK")
+                gloss_cache_put(cache, entries[custom_id]["cache_keys"][MODEL_NAME_GLOSS], gloss_hu, ex_surface, ex_lemma)
+            else:
+                # Batch API módban nincs újrapróbálás: ok: false-szal írjuk ki, nem cache-eljük
+                results[custom_id] = (MODEL_NAME_GLOSS, gloss_hu, ex_surface, ex_lemma, "OK [failed spell check]")
+        except ValueError as e:
+            results[custom_id] = (MODEL_NAME_GLOSS, "", "", "", f"ERROR: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Magyar glosszák generálása OpenAI-jal")
+    parser.add_argument("--batch", action="store_true", help="OpenAI Batch API használata (olcsóbb, de lassú)")
+    args = parser.parse_args()
+
+    out_dir = os.path.dirname(OUTPUT_PATH)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    init_speller()
+
+    print("Loading chunks (sentences)...")
+    chunks = load_chunks()
+    print(f"Loaded {len(chunks)} sentences from {CHUNKS_PATH}")
+
+    # a szavakat streameljük, a total-hoz csak a sorokat számoljuk meg
+    total_words = count_lines(WORDS_PATH)
+    print(f"Found {total_words} word entries in {WORDS_PATH}")
+    print(f"MAX_EXAMPLES_PER_WORD = {MAX_EXAMPLES_PER_WORD}")
+    print(f"GLOSS_BATCH_SIZE = {GLOSS_BATCH_SIZE}")
+    print(f"OPENAI_CONCURRENCY = {OPENAI_CONCURRENCY}")
+    print(f"Batch API: {args.batch}")
+
+    start_time = time.time()
+
+    cache = open_gloss_cache(CACHE_PATH)
+    try:
+        if args.batch:
+            written = asyncio.run(generate_all_batch_api(iter_word_recs(), total_words, chunks, cache, OUTPUT_PATH))
+        else:
+            with open(OUTPUT_PATH, "wb", buffering=OUTPUT_BUFFER_SIZE) as f_out:
+                written = asyncio.run(generate_all(iter_word_recs(), total_words, chunks, cache, f_out))
+    finally:
+        cache.commit()
+        cache.close()
 
     total_elapsed = time.time() - start_time
     print(f"Done, written {written} entries to {OUTPUT_PATH}")
+    print(f"Total elapsed time: {format_eta(int(total_elapsed))}")
     print(f"Estimated total input tokens:  {TOTAL_INPUT_TOKENS}")
     print(f"Estimated total output tokens: {TOTAL_OUTPUT_TOKENS}")
     print(f"Estimated total tokens (in+out): {TOTAL_INPUT_TOKENS + TOTAL_OUTPUT_TOKENS}")
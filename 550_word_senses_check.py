@@ -1,15 +1,28 @@
 import json
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import List
 
-import phunspell  # pip install phunspell
+import hunspell  # pip install hunspell (libhunspell C kötés)
 
 INPUT_PATH = "data/500_word_senses_openai.jsonl"
 OUTPUT_PATH = "data/550_word_senses_openai_bad.jsonl"  # csak a hibás sorok mennek ide
 
-# magyar + angol betűk – minimális formai szűréshez
-HU_WORD_RE = re.compile(r"^[A-Za-zÁÉÍÓÖŐÚÜŰáéíóöőúüű]+$")
+# magyar hunspell szótár (Debian/Ubuntu: apt install hunspell-hu)
+HUNSPELL_DIC = "/usr/share/hunspell/hu_HU.dic"
+HUNSPELL_AFF = "/usr/share/hunspell/hu_HU.aff"
+
+# a betöltött hunspell példány (init_speller állítja be)
+SPELLER = None
+
+# párhuzamos ellenőrzés: ennyi folyamat, egy feladatcsomagban ennyi glossza
+CHECK_N_PROCESS = os.cpu_count() or 1
+CHECK_CHUNKSIZE = 500
+
+# magyar + angol betűk – a glossza tokenizálásához
+HU_TOKEN_RE = re.compile(r"[A-Za-zÁÉÍÓÖŐÚÜŰáéíóöőúüű]+")
 
 
 def tokenize_hu(text: str) -> List[str]:
@@ -18,16 +31,30 @@ def tokenize_hu(text: str) -> List[str]:
     Pl. "elveszett kulcsok" -> ["elveszett", "kulcsok"]
         "fiókák, kacsák"   -> ["fiókák", "kacsák"]
     """
-    return re.findall(r"[A-Za-zÁÉÍÓÖŐÚÜŰáéíóöőúüű]+", text)
+    return HU_TOKEN_RE.findall(text)
+
 
+def init_speller() -> None:
+    """A magyar hunspell szótár betöltése (a SPELLER globálisba)."""
+    global SPELLER
+    SPELLER = hunspell.HunSpell(HUNSPELL_DIC, HUNSPELL_AFF)
 
-def meaning_is_probably_ok_hu(meaning: str, speller: phunspell.Phunspell) -> bool:
+
+@lru_cache(maxsize=100_000)
+def spell_ok(tok_norm: str) -> bool:
+    """
+    hunspell ellenőrzés egy (kisbetűs) tokenre, memoizálva – sok glossza
+    ugyanazokból a gyakori szavakból áll.
+    """
+    return SPELLER.spell(tok_norm)
+
+
+def meaning_is_probably_ok_hu(meaning: str) -> bool:
     """
     Akkor jó a glossza, ha:
       - van legalább egy token
-      - minden token:
-          * csak betűkből áll
-          * hunspell szerint helyes magyar szó
+      - minden token hunspell szerint helyes magyar szó
+        (hogy csak betűkből áll, azt a tokenizálás már garantálja)
 
     Ha nincs token -> False.
     Ha bármelyik token hibás -> False.
@@ -37,21 +64,13 @@ def meaning_is_probably_ok_hu(meaning: str, speller: phunspell.Phunspell) -> boo
         return False
 
     for tok in tokens:
-        tok_norm = tok.lower()
-
-        if not HU_WORD_RE.match(tok_norm):
-            return False
-
-        if not speller.lookup(tok_norm):
+        if not spell_ok(tok.lower()):
             return False
 
     return True
 
 
 def main():
-    # phunspell: magyar szótár – 'hu_HU'
-    speller = phunspell.Phunspell("hu_HU")
-
     out_dir = os.path.dirname(OUTPUT_PATH)
     if out_dir:
         os.makedirs(out_dir, exist_ok=True)
@@ -63,12 +82,14 @@ def main():
     print(f"Loaded {total} records from {INPUT_PATH}")
 
     bad = 0
-
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as outfile:
-        for rec in records:
-            meaning_hu = rec.get("meaning_hu", "") or ""
-
-            is_ok = meaning_is_probably_ok_hu(meaning_hu, speller)
+    meanings = [rec.get("meaning_hu", "") or "" for rec in records]
+
+    # a glosszákat CHECK_N_PROCESS folyamat ellenőrzi, mindegyik a saját
+    # hunspell példányával (initializer); a map sorrendtartó
+    with ProcessPoolExecutor(max_workers=CHECK_N_PROCESS, initializer=init_speller) as ex, \
+            open(OUTPUT_PATH, "w", encoding="utf-8") as outfile:
+        oks = ex.map(meaning_is_probably_ok_hu, meanings, chunksize=CHECK_CHUNKSIZE)
+        for rec, meaning_hu, is_ok in zip(records, meanings, oks):
             if not is_ok:
                 bad += 1
                 word = rec.get("word", "")
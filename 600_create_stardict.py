@@ -1,13 +1,15 @@
-import json
 import struct
 import datetime
-import subprocess
+import time
+import zlib
 from pathlib import Path
-from functools import cmp_to_key
+
+import orjson
 
 # --- KONSTANSOK ---
 
-# Bemeneti JSONL fájlok és a hozzájuk tartozó modellnevek
+# Bemeneti JSONL fájlok és a hozzájuk tartozó modellnevek (ezt akkor írjuk ki,
+# ha a sorban nincs "model" mező, azaz a régebbi kimenetekben)
 INPUT_SOURCES = [
     (Path("data/500_word_senses_openai.jsonl"), "GPT-5-mini"),
     (Path("data/500_word_senses_gemma3.jsonl"), "gemma3:27b"),
@@ -27,95 +29,86 @@ SAME_TYPE_SEQUENCE = "x"   # mint a működő eng-hung szótárban
 ENCODING = "UTF-8"
 LANG = "en-hu"
 
+# dictzip: ennyi nyers bájt kerül egy önállóan kitömöríthető chunkba
+# (a dictzip alapértelmezése; a chunk-tábla 16 bites mezői miatt ennél
+# nem lehet sokkal nagyobb)
+DICTZIP_CHUNK_LEN = 58315
+
+# .idx rekord vége: a szót lezáró \0 (pad bájt) + offset + méret
+# (big-endian uint32), egyszer fordítva
+IDX_RECORD_TAIL = struct.Struct(">xII")
+
 
 # --- StarDict-féle strcmp ---
 
 def _ascii_lower_bytes(b: bytes) -> bytes:
     """
     g_ascii_tolower byte-szinten: csak 'A'-'Z' -> 'a'-'z',
-    minden más bájt változatlan marad.
+    minden más bájt változatlan marad – pontosan ezt csinálja a bytes.lower()
+    (C-ben, a nem ASCII bájtokhoz nem nyúl).
     """
-    arr = bytearray(b)
-    for i, ch in enumerate(arr):
-        if 65 <= ch <= 90:  # 'A'..'Z'
-            arr[i] = ch + 32  # 'a'..'z'
-    return bytes(arr)
+    return b.lower()
 
 
-def stardict_strcmp(s1: str, s2: str) -> int:
+def stardict_sort_key(b: bytes) -> tuple[bytes, bytes]:
     """
-    Pythonos megfelelője a StarDict specifikációban leírt stardict_strcmp-nek:
+    Rendezési kulcs a StarDict specifikációban leírt stardict_strcmp-hez:
 
         a = g_ascii_strcasecmp(s1, s2)
         if (a == 0) return strcmp(s1, s2);
         else return a;
 
-    Itt mindent UTF-8 bájtokon értelmezünk.
-    """
-    b1 = s1.encode("utf-8")
-    b2 = s2.encode("utf-8")
-
-    # ASCII-case-insensitive összehasonlítás
-    c1 = _ascii_lower_bytes(b1)
-    c2 = _ascii_lower_bytes(b2)
-
-    if c1 < c2:
-        return -1
-    if c1 > c2:
-        return 1
+    A (kisbetűsített, eredeti) UTF-8 bájtpár tuple-összehasonlítása pontosan
+    ezt adja: előbb ASCII-case-insensitive, egyezésnél sima byte-szintű
+    strcmp. A kulcsot szavanként egyszer számoljuk (nem összehasonlításonként).
 
-    # Ha ASCII szerint egyenlő, akkor sima byte-szintű strcmp
-    if b1 < b2:
-        return -1
-    if b1 > b2:
-        return 1
-    return 0
+    A tipikus (csupa kisbetűs) címszónál a kisbetűsítés maga a szó: ilyenkor
+    nem készítünk róla másolatot.
+    """
+    return (b if b.islower() else _ascii_lower_bytes(b)), b
 
 
 # --- Szótár-építés ---
 
-def build_definition(entry: dict, seen_examples_for_word: set[str], source_label: str) -> str:
+def build_definition(entry: dict, word_b: bytes, seen_examples: set[int], source_label: str) -> str:
     """
-    Egy konkrét modell (source_label) egy sorát alakítjuk át definíciós blokká.
+    Egy konkrét modell egy sorát alakítjuk át definíciós blokká.
 
-    A jelentés sorában a modell neve is szerepel:
-        pl. "tégla (főnév) (GPT-5-mini)"
+    A jelentés sorában a választ adó modell neve is szerepel (a sor "model"
+    mezője, ha nincs, a forrás source_label-je):
+        pl. "tégla (főnév) (gpt-5-nano)"
     """
 
-    meaning_hu = (entry.get("meaning_hu") or "").strip()
-    pos_ai_hu = (entry.get("pos_hu") or "").strip()
-    example_surface_en = (entry.get("example_surface_en") or "").strip()
-    example_lemma_en = (entry.get("example_lemma_en") or "").strip()
+    get = entry.get
+    model = get("model") or source_label
+    meaning_hu = (get("meaning_hu") or "").strip()
+    pos_ai_hu = (get("pos_hu") or "").strip()
 
     lines = []
 
-    # első sor: jelentés (szófajjal + modellnévvel)
-    if meaning_hu:
+    # első sor: jelentés (szófajjal + modellnévvel); ha nincs magyar
+    # jelentés, fallback az angol szóra
+    head = meaning_hu or (get("word") or get("lemma") or "").strip()
+    if head:
         if pos_ai_hu:
-            lines.append(f"{meaning_hu} ({pos_ai_hu}) ({source_label})")
+            lines.append(f"{head} ({pos_ai_hu}) ({model})")
         else:
-            lines.append(f"{meaning_hu} ({source_label})")
-    else:
-        # ha nincs magyar jelentés, fallback az angol szóra
-        word = (entry.get("word") or entry.get("lemma") or "").strip()
-        if word:
-            if pos_ai_hu:
-                lines.append(f"{word} ({pos_ai_hu}) ({source_label})")
-            else:
-                lines.append(f"{word} ({source_label})")
+            lines.append(f"{head} ({model})")
 
     # példamondatok – szónként deduplikálva (függetlenül a modelltől)
-    if example_surface_en and example_surface_en not in seen_examples_for_word:
-        lines.append(example_surface_en)
-        seen_examples_for_word.add(example_surface_en)
-
-    if example_lemma_en and example_lemma_en not in seen_examples_for_word:
-        lines.append(example_lemma_en)
-        seen_examples_for_word.add(example_lemma_en)
+    # (egyetlen közös halmazban, a (szó, mondat) pár hash-ével: kisebb memória,
+    # és a 64 bites hash ütközése szótárméretnél elhanyagolható)
+    for key in ("example_surface_en", "example_lemma_en"):
+        example = (get(key) or "").strip()
+        if example:
+            h = hash((word_b, example))
+            if h not in seen_examples:
+                lines.append(example)
+                seen_examples.add(h)
 
     # fallback, ha minden üres
     if not lines:
-        fallback = (entry.get("word") or entry.get("lemma") or "<?>").strip()
+        fallback = (get("word") or get("lemma") or "<?>").strip()
         lines.append(fallback)
 
     return "\n".join(lines)
@@ -125,21 +118,29 @@ def load_entries_from_sources(sources: list[tuple[Path, str]]):
     """
     Több JSONL forrásból (különböző modellek) tölti be a szótári bejegyzéseket.
 
-    - word_to_def_blocks: word -> list[(source_label, definition_block)]
-    - word_to_seen_examples: word -> set[example_sentence] (példamondatok deduplikálásához)
+    - word_to_def_blocks: word (UTF-8 bájtok) -> list[definition_block] (modell-prioritás szerint)
+    - seen_examples: set[hash((word, example_sentence))] (példamondatok deduplikálásához, az összes szóra közösen)
+
+    Visszaad: [(word_bytes, definíció)] stardict_sort_key szerint rendezve.
     """
-    word_to_def_blocks: dict[str, list[tuple[str, str]]] = {}
-    word_to_seen_examples: dict[str, set[str]] = {}
+    word_to_def_blocks: dict[bytes, list[str]] = {}
+    seen_examples: set[int] = set()
+
+    # a forrásokat modell-prioritás szerint dolgozzuk fel (GPT-5-mini elöl): így
+    # minden szó blokklistája eleve ebben a sorrendben épül fel, és a
+    # példamondat-dedup is az elsődleges modell mondatait tartja meg
+    priority_index = {label: i for i, label in enumerate(MODEL_PRIORITY)}
+    sources = sorted(sources, key=lambda src: priority_index.get(src[1], 999))
 
     for jsonl_path, source_label in sources:
         print(f"Beolvasás: {jsonl_path} [{source_label}]")
-        with jsonl_path.open("r", encoding="utf-8") as f:
+        with jsonl_path.open("rb") as f:
             for line in f:
-                line = line.strip()
-                if not line:
+                # üres sor kihagyása; a sorvégi \n-t az orjson elfogadja, nem strip-elünk
+                if line.isspace():
                     continue
 
-                obj = json.loads(line)
+                obj = orjson.loads(line)
 
                 # ami "ok": false, azt kihagyjuk
                 if obj.get("ok") is False:
@@ -149,64 +150,108 @@ def load_entries_from_sources(sources: list[tuple[Path, str]]):
                 if not word:
                     continue
 
-                seen_examples = word_to_seen_examples.setdefault(word, set())
-                definition_block = build_definition(obj, seen_examples, source_label)
+                # a címszót egyszer kódoljuk: ezen rendezünk és ezt írjuk az .idx-be
+                word_b = word.encode("utf-8")
+
+                definition_block = build_definition(obj, word_b, seen_examples, source_label)
 
                 if definition_block:
-                    word_to_def_blocks.setdefault(word, []).append((source_label, definition_block))
+                    word_to_def_blocks.setdefault(word_b, []).append(definition_block)
 
     # egy angol szón belül a szófaji / modell blokkokat üres sorral választjuk el egymástól
     entries = []
 
-    # modell-prioritás sorrend
-    priority_index = {label: i for i, label in enumerate(MODEL_PRIORITY)}
-
-    for word in sorted(word_to_def_blocks.keys(), key=cmp_to_key(stardict_strcmp)):
-        blocks_with_labels = word_to_def_blocks[word]
-
-        # blokkok rendezése modell-prioritás szerint (GPT-5-mini elöl)
-        blocks_with_labels.sort(key=lambda pair: priority_index.get(pair[0], 999))
+    # (kulcs, szó, blokkok) hármasokat rendezünk: a kulcs egyedi (a szó bájtjait
+    # is tartalmazza), így csak a kulcsokat hasonlítjuk, és nem kell utána
+    # szavanként visszakeresni a dict-ben
+    keyed = [(stardict_sort_key(w), w, blocks) for w, blocks in word_to_def_blocks.items()]
+    keyed.sort()
 
-        blocks = [block for (_label, block) in blocks_with_labels]
+    for _key, word_b, blocks in keyed:
         full_definition = "\n\n".join(blocks)
-        entries.append((word, full_definition))
+        entries.append((word_b, full_definition))
 
     return entries
 
 
-def build_dict_and_idx(entries):
+def write_dictzip(dz_path: Path, orig_name: str, chunks: list[bytes], tail: bytes, crc: int, size: int):
     """
+    A dictzip-fájl (.dict.dz) kiírása: gzip fejléc a dictzip-féle "RA"
+    véletlen-elérési mezővel (FEXTRA: verzió, chunk-hossz, chunkok száma,
+    majd chunkonként a tömörített méret), az eredeti fájlnév (FNAME), a
+    tömörített chunkok, a záró deflate blokk, végül CRC32 + ISIZE.
+    """
+    ra_data = struct.pack(f"<HHH{len(chunks)}H", 1, DICTZIP_CHUNK_LEN, len(chunks), *(len(c) for c in chunks))
+    extra = b"RA" + struct.pack("<H", len(ra_data)) + ra_data
+    if len(extra) > 0xFFFF:
+        raise ValueError(f"túl sok dictzip chunk ({len(chunks)}), a .dict túl nagy")
+
+    # ID1 ID2 CM=deflate FLG=FEXTRA|FNAME MTIME XFL=max. tömörítés OS=Unix XLEN
+    header = struct.pack("<BBBBIBBH", 0x1F, 0x8B, 8, 0x04 | 0x08, int(time.time()), 2, 3, len(extra))
+
+    with dz_path.open("wb") as f:
+        f.write(header)
+        f.write(extra)
+        f.write(orig_name.encode("utf-8") + b"\x00")
+        f.writelines(chunks)
+        f.write(tail)
+        f.write(struct.pack("<II", crc, size & 0xFFFFFFFF))
+
+
+def write_dict_and_idx(entries, dz_path: Path, idx_path: Path) -> int:
+    """
+    Az .idx fájlt szócikkenként, közvetlenül a lemezre írjuk, a .dict
+    tartalmat pedig menet közben dictzip formátumban tömörítjük (.dict.dz):
+    nincs nyers .dict, amit utána egy külső dictzip újra beolvasna.
+
     .idx rekord: word\0 + offset(>I) + size(>I)
     .dict rekord (sametypesequence=x esetén):
         <k>word</k>\n
         definíció...
-    """
 
-    dict_chunks = []
-    idx_chunks = []
+    A .dict-et DICTZIP_CHUNK_LEN bájtos darabokra vágjuk, mindegyik után
+    Z_FULL_FLUSH, így a chunkok külön-külön kitömöríthetők (ahogy a dictzip).
+
+    Visszaad: az .idx fájl mérete (bájt), az .ifo idxfilesize mezőjéhez.
+    """
     offset = 0
+    idx_size = 0
+
+    # nyers deflate (-15), legjobb tömörítés – mint a dictzip
+    comp = zlib.compressobj(9, zlib.DEFLATED, -15, 9)
+    pending = bytearray()  # még nem tömörített .dict bájtok (< 1 chunk)
+    dz_chunks = []         # tömörített chunkok
+    crc = 0
+
+    with idx_path.open("wb") as ixf:
+        for word_bytes, definition in entries:
+            # mint a működő szótárban:
+            # <k>word</k>\n<definition>
+            def_bytes = b"<k>" + word_bytes + b"</k>\n" + definition.encode("utf-8")
 
-    for word, definition in entries:
-        word_bytes = word.encode("utf-8")
+            # .dict entry (tömörítve, chunkonként)
+            crc = zlib.crc32(def_bytes, crc)
+            pending += def_bytes
+            while len(pending) >= DICTZIP_CHUNK_LEN:
+                dz_chunks.append(comp.compress(pending[:DICTZIP_CHUNK_LEN]) + comp.flush(zlib.Z_FULL_FLUSH))
+                del pending[:DICTZIP_CHUNK_LEN]
 
-        # mint a működő szótárban:
-        # <k>word</k>\n<definition>
-        full_def_text = f"<k>{word}</k>\n{definition}"
-        def_bytes = full_def_text.encode("utf-8")
+            # .idx entry
+            ixf.write(word_bytes)
+            ixf.write(IDX_RECORD_TAIL.pack(offset, len(def_bytes)))
+            idx_size += len(word_bytes) + IDX_RECORD_TAIL.size
 
-        # .idx entry
-        idx_chunks.append(word_bytes + b"\x00")
-        idx_chunks.append(struct.pack(">I", offset))
-        idx_chunks.append(struct.pack(">I", len(def_bytes)))
+            offset += len(def_bytes)
 
-        # .dict entry
-        dict_chunks.append(def_bytes)
+    if pending:
+        dz_chunks.append(comp.compress(bytes(pending)) + comp.flush(zlib.Z_FULL_FLUSH))
+    # a záró (üres) deflate blokk – a dictzip sem veszi fel a chunk-táblába
+    tail = comp.flush()
 
-        offset += len(def_bytes)
+    orig_name = dz_path.name.removesuffix(".dz")
+    write_dictzip(dz_path, orig_name, dz_chunks, tail, crc, offset)
 
-    dict_data = b"".join(dict_chunks)
-    idx_data = b"".join(idx_chunks)
-    return dict_data, idx_data
+    return idx_size
 
 
 def write_ifo(ifo_path: Path, wordcount: int, idxfilesize: int):
@@ -249,44 +294,25 @@ def main():
     entries = load_entries_from_sources(existing_sources)
     print(f"Szócikkek száma (ok != false, címszavak): {len(entries)}")
 
-    print("dict / idx építése...")
-    dict_data, idx_data = build_dict_and_idx(entries)
-
-    dict_path = OUTPUT_DIR / f"{DICT_BASENAME}.dict"
+    dict_dz_path = OUTPUT_DIR / f"{DICT_BASENAME}.dict.dz"
     idx_path = OUTPUT_DIR / f"{DICT_BASENAME}.idx"
     ifo_path = OUTPUT_DIR / f"{DICT_BASENAME}.ifo"
 
-    # .dict nyers
-    with dict_path.open("wb") as f:
-        f.write(dict_data)
-
-    # .idx
-    with idx_path.open("wb") as f:
-        f.write(idx_data)
+    # .dict.dz (dictzip, menet közben tömörítve) + .idx
+    print("dict.dz / idx írása...")
+    idx_size = write_dict_and_idx(entries, dict_dz_path, idx_path)
 
     # .ifo
     write_ifo(
         ifo_path=ifo_path,
         wordcount=len(entries),
-        idxfilesize=len(idx_data),
+        idxfilesize=idx_size,
     )
 
-    # dictzip -> .dict.dz
-    try:
-        print("dictzip futtatása...")
-        subprocess.run(["dictzip", "-f", str(dict_path)], check=True)
-    except FileNotFoundError:
-        print("Figyelem: 'dictzip' nem található, .dict.dz nem készült (csak sima .dict).")
-    except subprocess.CalledProcessError as e:
-        print(f"dictzip hiba, exit code: {e.returncode}")
-
     print("Kész StarDict szótár fájlok:")
     print(f"  {ifo_path}")
     print(f"  {idx_path}")
-    print(f"  {dict_path}")
-    dict_dz_path = dict_path.with_suffix(".dict.dz")
-    if dict_dz_path.exists():
-        print(f"  {dict_dz_path}")
+    print(f"  {dict_dz_path}")
 
 
 if __name__ == "__main__":